@@ -1,20 +1,736 @@
 #!/usr/bin/env python3
 """
 EA Plan v6.8.0 - AIOps Decision Engine
-Enhanced anomaly detection with IsolationForest + Prophet
+Enhanced anomaly detection with IsolationForest + seasonal (daily/weekly) baselines
 Cross-correlation analysis and automated response triggers
 """
 
 import os
+import re
+import copy
 import json
+import fcntl
 import sys
+import time
+import shutil
+import struct
+import heapq
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 import numpy as np
 import pandas as pd
+import requests
+import joblib
+import sklearn
 from sklearn.ensemble import IsolationForest
 from prometheus_client import CollectorRegistry, Gauge, Counter, push_to_gateway
 
+try:
+    from fastapi import FastAPI, HTTPException, Request, Response
+    from fastapi.concurrency import run_in_threadpool
+    from pydantic import BaseModel
+except ImportError:
+    FastAPI = None
+
+try:
+    import snappy
+except ImportError:
+    snappy = None
+
+# Metrics analysed by the batch run and followed by the streaming service
+DEFAULT_METRICS = [
+    'cpt_seo_rank_drift_score',
+    'cpt_seo_position_delta',
+    'cpt_keyword_visibility_index',
+    'cpt_aiops_risk_score',
+    'http_requests_total'
+]
+
+# How missing steps are filled after aligning series on a shared time index
+GAP_POLICIES = ('ffill', 'interpolate', 'drop')
+
+# Scale factor turning a median absolute deviation into a normal-consistent sigma
+MAD_TO_SIGMA = 1.4826
+
+# Model input features derived per series (hour_of_week is shared by all series)
+FEATURE_KINDS = ('value', 'delta', 'rate', 'ewma', 'rolling_std', 'hour_of_week')
+
+# Features used unless AIOPS_FEATURES says otherwise. hour_of_week is opt-in:
+# a model trained on less than a week of data has never seen the hours the
+# decision horizon falls in, so it would flag them
+DEFAULT_FEATURE_KINDS = ('value', 'delta', 'rate', 'ewma', 'rolling_std')
+
+# Metric name suffixes treated as monotonic counters (rate is computed for these only)
+COUNTER_SUFFIXES = ('_total', '_count', '_sum', '_bucket')
+
+# Level features not derived for counters: a counter's level only grows, so
+# its newest rows always lie outside the range the model was trained on
+COUNTER_LEVEL_KINDS = ('value', 'ewma')
+
+# Seasonal periods removed by the seasonal baseline detector (seconds)
+SEASONAL_PERIODS = {'daily': 86400, 'weekly': 7 * 86400}
+
+# Range-query steps the adaptive resolution picks from (seconds)
+NICE_STEPS = (15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400)
+
+# Plain metric selectors, which can be pre-aggregated with <agg>_over_time(...)
+SELECTOR_PATTERN = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{.*\})?$')
+
+# One label="value" matcher of a series name, with its separating comma
+LABEL_MATCHER_PATTERN = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"\s*(?:,|$)')
+
+# Working-set cap for one batch of cross-spectra in lagged correlation
+CORRELATION_BATCH_BYTES = 256 * 1024 * 1024
+
+# IsolationForest hyperparameters unless the self-optimization loop's
+# hyperparameter search has written tuned ones (AIOPS_TUNED_CONFIG)
+DEFAULT_ISOLATION_FOREST_PARAMS = {'contamination': 0.1, 'n_estimators': 100, 'max_samples': 'auto'}
+
+
+def escape_label_value(value: str) -> str:
+    """A label value escaped for use inside a double-quoted PromQL matcher"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def add_matcher(selector: str, matcher: str) -> str:
+    """`selector` with one more label matcher, merged into its {...} set if it has one"""
+    if selector.endswith('}') and '{' in selector:
+        head, inner = selector[:-1].split('{', 1)
+        return f'{head}{{{inner},{matcher}}}' if inner.strip() else f'{head}{{{matcher}}}'
+    return f'{selector}{{{matcher}}}'
+
+
+def series_name(metric_name: str, labels: Dict[str, str]) -> str:
+    """Column name for one (metric, label set) series, in PromQL selector form"""
+    labels = {key: value for key, value in labels.items() if key != '__name__'}
+    if not labels:
+        return metric_name
+    selector = ','.join(f'{key}="{escape_label_value(labels[key])}"' for key in sorted(labels))
+    return f'{metric_name}{{{selector}}}'
+
+
+def series_labels(name: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Metric name and (label, escaped value) pairs of a series_name() column"""
+    if not name.endswith('}') or '{' not in name:
+        return name, []
+    metric_name, inner = name[:-1].split('{', 1)
+    labels, position = [], 0
+    while position < len(inner):
+        match = LABEL_MATCHER_PATTERN.match(inner, position)
+        if match is None:
+            raise ValueError(f'Malformed series name {name!r}')
+        labels.append((match.group(1), match.group(2)))
+        position = match.end()
+    return metric_name, labels
+
+
+def robust_center_scale(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-column median and MAD sigma (std where MAD is 0, 1 where both are)"""
+    median = np.median(matrix, axis=0)
+    mad = np.median(np.abs(matrix - median), axis=0) * MAD_TO_SIGMA
+    scale = np.where(mad > 0, mad, matrix.std(axis=0))
+    return median, np.where(scale > 0, scale, 1.0)
+
+
+def robust_zscores(matrix: np.ndarray) -> np.ndarray:
+    """Median/MAD z-scores of every column of a (time x series) matrix at once"""
+    median, scale = robust_center_scale(matrix)
+    return (matrix - median) / scale
+
+
+def lagged_cross_correlations(matrix: np.ndarray, max_lag: int, top_k: int,
+                              batch_bytes: int = CORRELATION_BATCH_BYTES) -> List[Tuple[float, int, int, int]]:
+    """Strongest lagged correlations over all column pairs of a (time x series) matrix.
+
+    Columns are standardized and zero-padded so one rFFT per column gives
+    every pair's cross-correlation at all lags in [-max_lag, max_lag] via
+    conj(F_i) * F_j. Rows of the pair matrix are processed in batches bounded
+    by `batch_bytes`; each batch's best candidates feed a bounded min-heap.
+    Returns [(correlation, i, j, lag), ...] for i < j, strongest |r| first.
+    A positive lag means column j follows column i by `lag` steps.
+    """
+    n, m = matrix.shape
+    if n < 2 or m < 2 or top_k <= 0:
+        return []
+    max_lag = max(0, min(max_lag, n - 1))
+    std = matrix.std(axis=0)
+    scaled = np.where(std > 0, (matrix - matrix.mean(axis=0)) / np.where(std > 0, std, 1.0), 0.0)
+    
+    # Padding to n + max_lag keeps circular wrap-around out of the lag window
+    nfft = 1 << int(np.ceil(np.log2(n + max_lag)))
+    spectra = np.fft.rfft(scaled, n=nfft, axis=0).T
+    lags = np.concatenate([np.arange(0, max_lag + 1), np.arange(-max_lag, 0)])
+    lag_index = lags % nfft
+    
+    rows_per_batch = max(1, batch_bytes // (m * nfft * 16))
+    columns = np.arange(m)
+    heap: List[Tuple[float, int, int, int, float]] = []
+    for start in range(0, m - 1, rows_per_batch):
+        rows = np.arange(start, min(start + rows_per_batch, m - 1))
+        cross = np.fft.irfft(np.conj(spectra[rows, None, :]) * spectra[None, :, :],
+                             n=nfft, axis=-1)[..., lag_index] / n
+        best = np.abs(cross).argmax(axis=-1)
+        r = np.take_along_axis(cross, best[..., None], axis=-1)[..., 0]
+        strength = np.where(columns[None, :] > rows[:, None], np.abs(r), -1.0).ravel()
+        
+        candidates = np.argpartition(strength, -top_k)[-top_k:] if strength.size > top_k else np.arange(strength.size)
+        for flat in candidates:
+            if strength[flat] < 0:
+                continue
+            row, j = divmod(int(flat), m)
+            item = (float(strength[flat]), int(rows[row]), j, int(lags[best[row, j]]), float(r[row, j]))
+            if len(heap) < top_k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    
+    return [(corr, i, j, lag) for _, i, j, lag, corr in sorted(heap, reverse=True)]
+
+
+def median_over_cycles(block: np.ndarray) -> np.ndarray:
+    """Median along axis 0 of a short (cycles x ...) stack.
+
+    An odd-even transposition network of elementwise minimum/maximum: each
+    step is one vectorized op over all phases and series, instead of a sort
+    call per (phase, series) slice.
+    """
+    layers = list(block)
+    for sweep in range(len(layers)):
+        for i in range(sweep % 2, len(layers) - 1, 2):
+            layers[i], layers[i + 1] = np.minimum(layers[i], layers[i + 1]), np.maximum(layers[i], layers[i + 1])
+    middle = len(layers) // 2
+    return layers[middle] if len(layers) % 2 else 0.5 * (layers[middle - 1] + layers[middle])
+
+
+def seasonal_residuals(matrix: np.ndarray, timestamps: np.ndarray, step_seconds: float,
+                       periods_seconds: List[float], max_cycles: int = 7) -> np.ndarray:
+    """Residuals of every column after seasonal profiles are removed.
+
+    For each period (in order) with at least two complete cycles of history,
+    the profile is the per-phase median over the latest `max_cycles`
+    complete cycles of what earlier profiles left; the first profile also
+    absorbs the level. All series are decomposed at once and the profile is
+    subtracted in place through a (cycles x phase x series) view. Rows must
+    be evenly spaced.
+    """
+    residual = np.array(matrix, dtype=float)
+    removed = False
+    for period in periods_seconds:
+        rows = int(round(period / step_seconds))
+        if rows < 2:
+            continue
+        # Unix epoch + 72h is Monday 00:00, so weekly phases follow calendar weeks
+        phase = (((timestamps + 72 * 3600) % period) // step_seconds).astype(np.int64) % rows
+        starts = np.flatnonzero(phase == 0)
+        if not starts.size:
+            continue
+        first = starts[0]
+        cycles = (len(residual) - first) // rows
+        if cycles < 2:
+            continue
+        last = first + cycles * rows
+        body = residual[first:last].reshape(cycles, rows, -1)
+        profile = median_over_cycles(body[-max_cycles:])
+        body -= profile
+        residual[:first] -= profile[phase[:first]]
+        residual[last:] -= profile[phase[last:]]
+        removed = True
+    if not removed:
+        residual -= np.median(residual, axis=0)
+    return residual
+
+
+def lttb(x: np.ndarray, values: np.ndarray, n_out: int, bounds: Optional[np.ndarray] = None) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling of every column at once.
+
+    `values` is (time x series) on the shared time axis `x`. Keeps the first
+    row of the first bucket and the last row of the last one and, per inner
+    bucket, the point forming the largest triangle with the previously kept
+    point and the next bucket's mean, so spikes and turns survive. The
+    bucket loop runs n_out times; each step is vectorized across series.
+    Returns an (n_out x series) array.
+
+    `bounds` (n_out + 1 row offsets, every bucket non-empty) fixes the
+    buckets, e.g. to the cells of an output time grid so every kept point
+    lies within its own cell; by default the inner rows are split evenly.
+    """
+    n, m = values.shape
+    if bounds is None:
+        if n_out >= n or n_out < 3:
+            return values
+        every = (n - 2) / (n_out - 2)
+        bounds = np.concatenate([[0], np.floor(np.arange(n_out - 1) * every) + 1, [n]]).astype(np.int64)
+        bounds[-2] = n - 1
+    
+    selected = np.empty((n_out, m))
+    selected[0], selected[-1] = values[bounds[0]], values[bounds[-1] - 1]
+    series = np.arange(m)
+    prev_x, prev_y = np.full(m, x[bounds[0]]), selected[0].copy()
+    
+    # Mean of the bucket after each inner bucket, all at once
+    sizes = np.diff(bounds[2:])[:, None]
+    next_x = np.add.reduceat(x, bounds[2:-1]) / sizes[:, 0]
+    next_y = np.add.reduceat(values, bounds[2:-1], axis=0) / sizes
+    
+    for i in range(n_out - 2):
+        lo, hi = bounds[i + 1], bounds[i + 2]
+        avg_x, avg_y = next_x[i], next_y[i]
+        bucket_x, bucket_y = x[lo:hi], values[lo:hi]
+        area = np.abs((prev_x - avg_x) * (bucket_y - prev_y)
+                      - (prev_x - bucket_x[:, None]) * (avg_y - prev_y))
+        pick = area.argmax(axis=0)
+        selected[i + 1] = bucket_y[pick, series]
+        prev_x, prev_y = bucket_x[pick], selected[i + 1]
+    
+    return selected
+
+
+def data_fingerprint(metrics_df: pd.DataFrame) -> str:
+    """Stable hash of a metric matrix's columns, index and values"""
+    digest = hashlib.sha256('\x1f'.join(map(str, metrics_df.columns)).encode())
+    digest.update(metrics_df.index.asi8.tobytes() if isinstance(metrics_df.index, pd.DatetimeIndex) else b'')
+    digest.update(np.ascontiguousarray(metrics_df.to_numpy(dtype=float)).tobytes())
+    return digest.hexdigest()[:32]
+
+
+class UnionFind:
+    """Disjoint sets over hashable keys, with path halving and union by size"""
+
+    def __init__(self):
+        self.parent: Dict[Any, Any] = {}
+        self.size: Dict[Any, int] = {}
+
+    def add(self, key):
+        if key not in self.parent:
+            self.parent[key] = key
+            self.size[key] = 1
+
+    def find(self, key):
+        self.add(key)
+        while self.parent[key] != key:
+            self.parent[key] = self.parent[self.parent[key]]
+            key = self.parent[key]
+        return key
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+
+class FeaturePipeline:
+    """Rolling per-series features for the anomaly model.
+
+    Features: value, delta, counter-reset-aware per-second rate (counters
+    only), EWMA, rolling std over the last `window` steps, and a sin/cos
+    hour-of-week encoding. Counters get no value or EWMA (level) columns. `backfill` computes a whole matrix with
+    sliding-window sums; `update` advances the same state by one aligned
+    sample in O(1) per series, independent of how much history is retained.
+    Column order is fixed by the series list, so the model sees a stable
+    feature matrix.
+    """
+
+    def __init__(self, series: List[str], kinds: Tuple[str, ...] = DEFAULT_FEATURE_KINDS,
+                 window: int = 12, ewma_alpha: float = 0.3):
+        unknown = set(kinds) - set(FEATURE_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown feature kinds {sorted(unknown)}, expected a subset of {FEATURE_KINDS}")
+        self.series = list(series)
+        self.kinds = tuple(kind for kind in FEATURE_KINDS if kind in kinds)
+        self.window = window
+        self.alpha = ewma_alpha
+        self.counter = np.array([name.split('{', 1)[0].endswith(COUNTER_SUFFIXES) for name in self.series], dtype=bool)
+        
+        m = len(self.series)
+        self.ring = np.zeros((m, window))
+        self.position = 0
+        self.count = 0
+        self.offset = np.zeros(m)
+        self.total = np.zeros(m)
+        self.total_sq = np.zeros(m)
+        self.last = np.zeros(m)
+        self.last_timestamp = 0.0
+        self.ewma = np.zeros(m)
+        self.columns = self._columns()
+    
+    def _columns(self) -> List[str]:
+        columns = []
+        for kind in self.kinds:
+            if kind == 'hour_of_week':
+                columns += ['hour_of_week_sin', 'hour_of_week_cos']
+            elif kind == 'rate':
+                columns += [f'{name}::rate' for name, counter in zip(self.series, self.counter) if counter]
+            elif kind in COUNTER_LEVEL_KINDS:
+                columns += [f'{name}::{kind}' for name, counter in zip(self.series, self.counter) if not counter]
+            else:
+                columns += [f'{name}::{kind}' for name in self.series]
+        return columns
+    
+    def _assemble(self, blocks: Dict[str, np.ndarray], timestamps: np.ndarray) -> np.ndarray:
+        parts = []
+        for kind in self.kinds:
+            if kind == 'hour_of_week':
+                # Unix epoch is a Thursday: +72h puts Monday 00:00 at hour 0
+                angle = 2 * np.pi * (((timestamps / 3600.0) + 72) % 168) / 168
+                parts += [np.sin(angle)[:, None], np.cos(angle)[:, None]]
+            elif kind == 'rate':
+                parts.append(blocks['rate'][:, self.counter])
+            elif kind in COUNTER_LEVEL_KINDS:
+                parts.append(blocks[kind][:, ~self.counter])
+            else:
+                parts.append(blocks[kind])
+        return np.concatenate(parts, axis=1)
+    
+    def backfill(self, metrics_df: pd.DataFrame) -> pd.DataFrame:
+        """Features for every row of `metrics_df`; leaves the state at its last row"""
+        values = metrics_df[self.series].to_numpy(dtype=float)
+        timestamps = metrics_df.index.asi8 / 1e9
+        n = len(values)
+        if n == 0:
+            return pd.DataFrame(columns=self.columns, index=metrics_df.index, dtype=float)
+        
+        delta = np.diff(values, axis=0, prepend=values[:1])
+        elapsed = np.diff(timestamps, prepend=timestamps[0])[:, None]
+        increase = np.where(delta >= 0, delta, values)
+        increase[0] = 0.0
+        rate = np.divide(increase, elapsed, out=np.zeros_like(increase), where=elapsed > 0)
+        ewma = pd.DataFrame(values).ewm(alpha=self.alpha, adjust=False).mean().to_numpy()
+        
+        # Windowed sums over zero-padded history: row t sums its last min(t+1, window) values
+        self.offset = values[0].copy()
+        centered = values - self.offset
+        padded = np.vstack([np.zeros((self.window - 1, values.shape[1])), centered])
+        total = np.lib.stride_tricks.sliding_window_view(padded, self.window, axis=0).sum(axis=-1)
+        total_sq = np.lib.stride_tricks.sliding_window_view(padded ** 2, self.window, axis=0).sum(axis=-1)
+        filled = np.minimum(np.arange(1, n + 1), self.window)[:, None]
+        mean = total / filled
+        rolling_std = np.sqrt(np.maximum(total_sq / filled - mean ** 2, 0.0))
+        
+        features = self._assemble({'value': values, 'delta': delta, 'rate': rate, 'ewma': ewma,
+                                   'rolling_std': rolling_std}, timestamps)
+        
+        # Continue incrementally from the last row
+        tail = np.arange(max(0, n - self.window), n)
+        self.ring[:, tail % self.window] = centered[tail].T
+        self.position = n % self.window
+        self.count = min(n, self.window)
+        self.total, self.total_sq = total[-1].copy(), total_sq[-1].copy()
+        self.last, self.last_timestamp, self.ewma = values[-1].copy(), float(timestamps[-1]), ewma[-1].copy()
+        return pd.DataFrame(features, index=metrics_df.index, columns=self.columns)
+    
+    def update(self, values: np.ndarray, timestamp: float, commit: bool = True) -> np.ndarray:
+        """Feature row for one new sample per series (in `series` order).
+
+        With commit=False the state is left untouched, for scoring a
+        hypothetical sample.
+        """
+        values = np.asarray(values, dtype=float)
+        if self.count == 0:
+            self.offset = values.copy()
+            delta = rate = np.zeros_like(values)
+            ewma = values
+        else:
+            delta = values - self.last
+            elapsed = timestamp - self.last_timestamp
+            increase = np.where(delta >= 0, delta, values)
+            rate = increase / elapsed if elapsed > 0 else np.zeros_like(values)
+            ewma = self.alpha * values + (1 - self.alpha) * self.ewma
+        
+        centered = values - self.offset
+        evicted = self.ring[:, self.position] if self.count == self.window else 0.0
+        total = self.total + centered - evicted
+        total_sq = self.total_sq + centered ** 2 - evicted ** 2
+        filled = min(self.count + 1, self.window)
+        mean = total / filled
+        rolling_std = np.sqrt(np.maximum(total_sq / filled - mean ** 2, 0.0))
+        
+        if commit:
+            self.ring[:, self.position] = centered
+            self.position = (self.position + 1) % self.window
+            self.count = filled
+            self.total, self.total_sq = total, total_sq
+            self.last, self.last_timestamp, self.ewma = values, float(timestamp), ewma
+            if self.position == 0:
+                # Re-sum each full turn of the ring so float error cannot accumulate
+                self.total, self.total_sq = self.ring.sum(axis=1), (self.ring ** 2).sum(axis=1)
+        
+        return self._assemble({'value': values[None], 'delta': delta[None], 'rate': rate[None],
+                               'ewma': ewma[None], 'rolling_std': rolling_std[None]},
+                              np.array([timestamp], dtype=float))[0]
+
+
+class ModelRegistry:
+    """Versioned on-disk registry of trained anomaly models.
+
+    Layout: versions/v<N>/{model.joblib, metadata.json}, a CURRENT pointer and
+    a promotions log. Versions are written into a temp dir and renamed into
+    place; CURRENT is swapped with os.replace, so promote and rollback are
+    atomic and a reader always sees a complete version. Writers (tenant
+    analyzer, self-optimization jobs) serialize on a flock of the registry,
+    so two of them never claim the same version number.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+        self.current_path = os.path.join(root, 'CURRENT')
+        self.promotions_path = os.path.join(root, 'promotions.json')
+        self.lock_path = os.path.join(root, '.lock')
+        os.makedirs(self.versions_dir, exist_ok=True)
+        self._cache: Optional[Tuple[int, Any, Dict[str, Any]]] = None
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def _write_atomic(self, path: str, content: str):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def versions(self) -> List[int]:
+        """All registered versions, oldest first"""
+        return sorted(int(name[1:]) for name in os.listdir(self.versions_dir) if name.startswith('v'))
+
+    def current_version(self) -> Optional[int]:
+        try:
+            with open(self.current_path) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def promotions(self) -> List[int]:
+        try:
+            with open(self.promotions_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def register(self, model: Any, metadata: Dict[str, Any]) -> int:
+        """Store a model as the next version (not yet promoted)"""
+        tmp_dir = tempfile.mkdtemp(dir=self.root)
+        joblib.dump(model, os.path.join(tmp_dir, 'model.joblib'))
+        with self._locked():
+            version = (max(self.versions(), default=0)) + 1
+            metadata = {**metadata, 'version': version, 'created_at': datetime.now().isoformat()}
+            with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+                json.dump(metadata, f, indent=2)
+            os.rename(tmp_dir, os.path.join(self.versions_dir, f'v{version}'))
+        return version
+
+    def promote(self, version: int):
+        """Make `version` the current model"""
+        with self._locked():
+            if version not in self.versions():
+                raise ValueError(f'Unknown model version {version}')
+            self._write_atomic(self.current_path, str(version))
+            self._write_atomic(self.promotions_path, json.dumps(self.promotions() + [version]))
+
+    def rollback(self) -> Optional[int]:
+        """Re-promote the previously promoted version; returns it, or None"""
+        with self._locked():
+            history = self.promotions()
+            if len(history) < 2:
+                return None
+            history.pop()
+            previous = history[-1]
+            self._write_atomic(self.current_path, str(previous))
+            self._write_atomic(self.promotions_path, json.dumps(history))
+        return previous
+
+    def load_current(self) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """(model, metadata) of the current version; cached per version in-process"""
+        version = self.current_version()
+        if version is None:
+            return None
+        if self._cache is not None and self._cache[0] == version:
+            return self._cache[1], self._cache[2]
+
+        version_dir = os.path.join(self.versions_dir, f'v{version}')
+        model = joblib.load(os.path.join(version_dir, 'model.joblib'))
+        with open(os.path.join(version_dir, 'metadata.json')) as f:
+            metadata = json.load(f)
+        self._cache = (version, model, metadata)
+        return model, metadata
+
+    def prune(self, keep: int):
+        """Delete the oldest versions beyond `keep`, never the current one"""
+        current = self.current_version()
+        for version in self.versions()[:-keep]:
+            if version != current:
+                shutil.rmtree(os.path.join(self.versions_dir, f'v{version}'), ignore_errors=True)
+
+
+def read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    """Decode a protobuf varint at `pos`; returns (value, next position)"""
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_protobuf_fields(buf: bytes):
+    """Yield (field number, wire type, raw value) for each field of a protobuf message"""
+    pos = 0
+    while pos < len(buf):
+        key, pos = read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(buf, pos)
+        elif wire_type == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f'Unsupported protobuf wire type {wire_type}')
+        yield field, wire_type, value
+
+
+def decode_remote_write(payload: bytes) -> List[Tuple[Dict[str, str], List[Tuple[float, float]]]]:
+    """Decode an uncompressed Prometheus remote-write WriteRequest.
+
+    Returns [(labels, [(unix seconds, value), ...]), ...]. Only timeseries
+    (field 1) are read; metadata and exemplars are skipped.
+    """
+    timeseries = []
+    for field, _, raw_series in iter_protobuf_fields(payload):
+        if field != 1:
+            continue
+        labels, samples = {}, []
+        for series_field, _, raw in iter_protobuf_fields(raw_series):
+            if series_field == 1:
+                label = {number: value for number, _, value in iter_protobuf_fields(raw)}
+                labels[label.get(1, b'').decode()] = label.get(2, b'').decode()
+            elif series_field == 2:
+                sample = {number: value for number, _, value in iter_protobuf_fields(raw)}
+                value = struct.unpack('<d', sample[1])[0] if 1 in sample else 0.0
+                timestamp_ms = sample.get(2, 0)
+                if timestamp_ms >= 1 << 63:
+                    timestamp_ms -= 1 << 64
+                samples.append((timestamp_ms / 1000.0, value))
+        timeseries.append((labels, samples))
+    return timeseries
+
+
+class OnlineAnomalyDetector:
+    """Streaming z-score detector over a sliding window of recent samples per series.
+
+    Each series keeps a ring buffer of its last `window` samples plus running
+    sum and sum of squares, so scoring and updating a sample is O(1). Samples
+    are winsorized at +/- threshold sigma before entering the window, which
+    keeps a burst of outliers from inflating the baseline it is scored on.
+    A poll of many series is one vectorized update over their rows.
+    """
+
+    def __init__(self, window: int = 360, threshold: float = 4.0, warmup: int = 30):
+        self.window = window
+        self.threshold = threshold
+        self.warmup = min(warmup, window)
+        self.rows: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.buffer = np.zeros((0, window))
+        self.position = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0)
+        self.total_sq = np.zeros(0)
+        self.last_z = np.zeros(0)
+        self.last_value = np.zeros(0)
+        self.last_seen = np.zeros(0)
+
+    def _grow(self, capacity: int):
+        extra = capacity - len(self.position)
+        self.buffer = np.vstack([self.buffer, np.zeros((extra, self.window))])
+        self.position = np.concatenate([self.position, np.zeros(extra, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        for attr in ('total', 'total_sq', 'last_z', 'last_value', 'last_seen'):
+            setattr(self, attr, np.concatenate([getattr(self, attr), np.zeros(extra)]))
+
+    def rows_for(self, names: List[str]) -> np.ndarray:
+        """Row index of each series, registering unseen ones"""
+        for name in names:
+            if name not in self.rows:
+                self.rows[name] = len(self.names)
+                self.names.append(name)
+        if len(self.names) > len(self.position):
+            self._grow(max(64, 2 * len(self.names)))
+        return np.fromiter((self.rows[name] for name in names), dtype=np.int64, count=len(names))
+
+    def update(self, names: List[str], values, timestamp=None) -> np.ndarray:
+        """Score one new sample for each named series, then add it to the window.
+
+        `names` must be unique within a call; `timestamp` is one time for all
+        samples or one per sample. Returns the z-scores, 0 while a series is
+        still warming up.
+        """
+        rows = self.rows_for(names)
+        values = np.asarray(values, dtype=float)
+        count = self.count[rows]
+        filled = np.maximum(count, 1)
+        mean = self.total[rows] / filled
+        std = np.sqrt(np.maximum(self.total_sq[rows] / filled - mean ** 2, 0.0))
+        ready = (count >= self.warmup) & (std > 0)
+        
+        z = np.where(ready, (values - mean) / np.where(std > 0, std, 1.0), 0.0)
+        admitted = np.where(ready, np.clip(values, mean - self.threshold * std, mean + self.threshold * std), values)
+        
+        position = self.position[rows]
+        evicted = np.where(count >= self.window, self.buffer[rows, position], 0.0)
+        self.buffer[rows, position] = admitted
+        self.total[rows] += admitted - evicted
+        self.total_sq[rows] += admitted ** 2 - evicted ** 2
+        self.count[rows] = np.minimum(count + 1, self.window)
+        self.position[rows] = (position + 1) % self.window
+        
+        # Re-sum wrapped windows from the buffer so float error cannot accumulate
+        wrapped = rows[self.position[rows] == 0]
+        if len(wrapped):
+            self.total[wrapped] = self.buffer[wrapped].sum(axis=1)
+            self.total_sq[wrapped] = (self.buffer[wrapped] ** 2).sum(axis=1)
+        
+        self.last_z[rows] = z
+        self.last_value[rows] = values
+        self.last_seen[rows] = time.time() if timestamp is None else timestamp
+        return z
+
+    def anomalies(self, max_age_seconds: float, limit: int = 100) -> List[Dict[str, Any]]:
+        """Series whose latest sample is anomalous, strongest first"""
+        active = len(self.names)
+        fresh = self.last_seen[:active] >= time.time() - max_age_seconds
+        flagged = np.flatnonzero(fresh & (np.abs(self.last_z[:active]) >= self.threshold))
+        flagged = flagged[np.argsort(-np.abs(self.last_z[flagged]))][:limit]
+        return [
+            {
+                'series': self.names[row],
+                'timestamp': datetime.fromtimestamp(self.last_seen[row]).isoformat(),
+                'value': float(self.last_value[row]),
+                'zscore': float(self.last_z[row]),
+                'severity': 'high' if abs(self.last_z[row]) >= 2 * self.threshold else 'medium'
+            }
+            for row in flagged
+        ]
+
 
 class AIOpsDecisionEngine:
     """Enhanced AIOps decision engine with advanced ML"""
@@ -24,6 +740,41 @@ class AIOpsDecisionEngine:
         self.prometheus_url = os.getenv('PROMETHEUS_URL', 'http://prometheus:9090')
         self.auto_remediate = os.getenv('AIOPS_AUTO_REMEDIATE', 'false').lower() == 'true'
         self.decision_threshold = float(os.getenv('AIOPS_DECISION_THRESHOLD', '0.7'))
+        self.gap_policy = os.getenv('AIOPS_GAP_POLICY', 'ffill')
+        self.fetch_concurrency = int(os.getenv('AIOPS_FETCH_CONCURRENCY', '16'))
+        self.query_timeout = float(os.getenv('AIOPS_QUERY_TIMEOUT', '10'))
+        self.session = requests.Session()
+        
+        # Series cardinality bounds for labeled metrics
+        self.max_series_per_metric = int(os.getenv('AIOPS_MAX_SERIES_PER_METRIC', '1000'))
+        self.max_series = int(os.getenv('AIOPS_MAX_SERIES', '5000'))
+        self.top_k_series = int(os.getenv('AIOPS_TOP_K_SERIES', '1000'))
+        self.anomaly_top_series = int(os.getenv('AIOPS_ANOMALY_TOP_SERIES', '10'))
+        # Series an IsolationForest anomaly is attributed to must deviate this much
+        self.attribution_zscore = float(os.getenv('AIOPS_ATTRIBUTION_ZSCORE', '3.0'))
+        self.feature_kinds = tuple(kind for kind in os.getenv('AIOPS_FEATURES', ','.join(DEFAULT_FEATURE_KINDS)).split(',') if kind)
+        self.feature_window = int(os.getenv('AIOPS_FEATURE_WINDOW', '12'))
+        self.feature_ewma_alpha = float(os.getenv('AIOPS_FEATURE_EWMA_ALPHA', '0.3'))
+        # (pipeline, features) of the last analysed window, advanced by window_features
+        self.feature_state: Optional[Tuple[FeaturePipeline, pd.DataFrame]] = None
+        
+        # Adaptive range-query resolution
+        self.point_budget = int(os.getenv('AIOPS_POINT_BUDGET', '1440'))
+        self.fetch_oversample = int(os.getenv('AIOPS_FETCH_OVERSAMPLE', '4'))
+        self.min_step_seconds = int(os.getenv('AIOPS_MIN_STEP_SECONDS', '15'))
+        self.query_max_points = int(os.getenv('AIOPS_QUERY_MAX_POINTS', '10000'))
+        self.over_time_agg = os.getenv('AIOPS_OVER_TIME_AGG', 'max')
+        self.seasonal_days = float(os.getenv('AIOPS_SEASONAL_DAYS', '21'))
+        self.seasonal_periods = [name for name in os.getenv('AIOPS_SEASONAL_PERIODS', 'daily,weekly').split(',') if name]
+        self.seasonal_threshold = float(os.getenv('AIOPS_SEASONAL_THRESHOLD', '4.0'))
+        self.incident_window_minutes = float(os.getenv('AIOPS_INCIDENT_WINDOW_MINUTES', '15'))
+        self.incident_min_correlation = float(os.getenv('AIOPS_INCIDENT_MIN_CORRELATION', '0.7'))
+        self.decision_horizon_minutes = float(os.getenv('AIOPS_DECISION_HORIZON_MINUTES', '60'))
+        self.anomaly_excess_factor = float(os.getenv('AIOPS_ANOMALY_EXCESS_FACTOR', '3.0'))
+        self.high_severity_margin = float(os.getenv('AIOPS_HIGH_SEVERITY_MARGIN', '0.1'))
+        self.correlation_max_lag_seconds = float(os.getenv('AIOPS_CORRELATION_MAX_LAG_SECONDS', '21600'))
+        self.correlation_top_k = int(os.getenv('AIOPS_CORRELATION_TOP_K', '50'))
+        self.metric_names = [name for name in os.getenv('AIOPS_METRICS', ','.join(DEFAULT_METRICS)).split(',') if name]
         
         # Prometheus metrics
         self.registry = CollectorRegistry()
@@ -33,148 +784,685 @@ class AIOpsDecisionEngine:
                                         registry=self.registry)
         self.auto_remediate_count = Counter('cpt_auto_remediate_total', 'Total auto-remediation actions', 
                                            ['action_type'], registry=self.registry)
-        self.alert_reduction = Gauge('cpt_alert_reduction_percentage', 'Alert noise reduction percentage', 
-                                    registry=self.registry)
+        self.alert_reduction = Gauge('cpt_alert_reduction_percentage',
+                                     'Alert noise reduction percentage (incidents vs per-series alert episodes)',
+                                     registry=self.registry)
+        self.alert_risk_score = Gauge('cpt_aiops_alert_risk_score', 'Risk score of the latest alert-triggered analysis',
+                                      ['alertname'], registry=self.registry)
         
-        # ML models
-        self.isolation_forest = IsolationForest(contamination=0.1, random_state=42)
+        # ML models (persisted across runs in the model registry)
+        self.tuned_config_path = os.getenv('AIOPS_TUNED_CONFIG', '/var/lib/self-opt-shared/tuned-config.json')
+        self.isolation_forest = IsolationForest(**self.isolation_forest_params(), random_state=42)
         self.is_trained = False
+        self.model_metadata: Dict[str, Any] = {}
+        self.model_registry = ModelRegistry(os.getenv('AIOPS_MODEL_DIR', '/tmp/aiops/models'))
+        self.retrain_hours = float(os.getenv('AIOPS_RETRAIN_HOURS', '24'))
+        self.drift_threshold = float(os.getenv('AIOPS_DRIFT_THRESHOLD', '3.0'))
+        self.range_drift_fraction = float(os.getenv('AIOPS_RANGE_DRIFT_FRACTION', '0.1'))
+        self.min_feature_overlap = float(os.getenv('AIOPS_MIN_FEATURE_OVERLAP', '0.9'))
+        self.model_versions_kept = int(os.getenv('AIOPS_MODEL_VERSIONS_KEPT', '10'))
+    
+    def query_range(self, query: str, start: float, end: float, step_seconds: int) -> List[Dict[str, Any]]:
+        """Run a Prometheus range query and return its result series"""
+        prometheus_url = f"{self.prometheus_url}/api/v1/query_range"
+        params = {
+            'query': query,
+            'start': start,
+            'end': end,
+            'step': f'{step_seconds}s'
+        }
+        
+        response = self.session.get(prometheus_url, params=params, timeout=self.query_timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Prometheus API error {response.status_code}")
+        
+        data = response.json()
+        if data.get('status') != 'success':
+            raise RuntimeError(f"Prometheus query failed: {data.get('error', 'unknown error')}")
+        return data.get('data', {}).get('result', [])
+    
+    def query_instant(self, query: str) -> List[Dict[str, Any]]:
+        """Run a Prometheus instant query and return its result vector"""
+        response = self.session.get(f"{self.prometheus_url}/api/v1/query",
+                                    params={'query': query}, timeout=self.query_timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Prometheus API error {response.status_code}")
+        
+        data = response.json()
+        if data.get('status') != 'success':
+            raise RuntimeError(f"Prometheus query failed: {data.get('error', 'unknown error')}")
+        return data.get('data', {}).get('result', [])
+    
+    def choose_step(self, span_seconds: float, points: int) -> int:
+        """Smallest nice step that keeps `span_seconds` within `points` samples"""
+        needed = max(span_seconds / max(points, 1), self.min_step_seconds)
+        for step in NICE_STEPS:
+            if step >= needed:
+                return step
+        return int(np.ceil(needed / 86400) * 86400)
     
-    def fetch_metrics(self, metric_names: List[str], hours: int = 24) -> pd.DataFrame:
-        """Fetch metrics from Prometheus API"""
+    def range_query(self, metric_name: str, step_seconds: int) -> str:
+        """PromQL for one metric at `step_seconds`, pre-aggregated server-side.
+        
+        Plain selectors become <agg>_over_time(selector[step]) when the step
+        exceeds the minimum, so a spike between two steps still shows up;
+        other expressions are queried as given.
+        """
+        if (self.over_time_agg in ('', 'none') or step_seconds <= self.min_step_seconds
+                or not SELECTOR_PATTERN.match(metric_name)):
+            return metric_name
+        return f'{self.over_time_agg}_over_time({metric_name}[{step_seconds}s])'
+    
+    def query_chunks(self, start: float, end: float, step_seconds: int) -> List[Tuple[float, float]]:
+        """Split a range into back-to-back sub-ranges of at most query_max_points steps"""
+        span = self.query_max_points * step_seconds
+        chunks = []
+        while start <= end:
+            chunks.append((start, min(start + span - step_seconds, end)))
+            start += span
+        return chunks
+    
+    def fetch_series(self, metric_name: str, start: float, end: float,
+                     step_seconds: int) -> Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+        """Fetch every series of one metric as {series name: (unix timestamps, values)}.
+        
+        Returns None when the query fails or has no data.
+        """
         try:
-            import requests
+            result = self.query_range(self.range_query(metric_name, step_seconds), start, end, step_seconds)
+            series = {}
+            for item in result[:self.max_series_per_metric]:
+                if item.get('values'):
+                    # [[ts, "value"], ...] -> (n, 2) float array in one conversion
+                    raw = np.asarray(item['values'], dtype=float)
+                    labels = item.get('metric', {})
+                    base_name = labels.get('__name__', metric_name.split('{', 1)[0])
+                    series[series_name(base_name, labels)] = (raw[:, 0], raw[:, 1])
             
+            if len(result) > self.max_series_per_metric:
+                print(f"⚠️  {metric_name}: keeping {self.max_series_per_metric} of {len(result)} series")
+            if not series:
+                print(f"⚠️  No data for metric {metric_name}")
+                return None
+            return series
+        
+        except Exception as e:
+            print(f"⚠️  Error fetching {metric_name}: {e}")
+            return None
+    
+    def align_series(self, series: Dict[str, Optional[Tuple[np.ndarray, np.ndarray]]],
+                     start: float, end: float, step_seconds: int,
+                     gap_policy: str = 'ffill') -> pd.DataFrame:
+        """Outer-join series onto one step-aligned time index and apply a gap policy.
+        
+        Every series is scattered into its own column of a shared (time x
+        metric) matrix by integer bucket position, so series with gaps or
+        different lengths always line up. Failed series become zero columns.
+        """
+        if gap_policy not in GAP_POLICIES:
+            raise ValueError(f"Unknown gap policy '{gap_policy}', expected one of {GAP_POLICIES}")
+        
+        first = start - start % step_seconds
+        index = np.arange(first, end + 1, step_seconds, dtype=float)
+        matrix = np.full((index.size, len(series)), np.nan)
+        
+        for column, values in enumerate(series.values()):
+            if values is None:
+                matrix[:, column] = 0.0
+                continue
+            timestamps, metric_values = values
+            positions = np.rint((timestamps - first) / step_seconds).astype(np.int64)
+            in_range = (positions >= 0) & (positions < index.size)
+            matrix[positions[in_range], column] = metric_values[in_range]
+        
+        df = pd.DataFrame(matrix, index=pd.to_datetime(index, unit='s'), columns=list(series))
+        
+        if gap_policy == 'ffill':
+            df = df.ffill().bfill()
+        elif gap_policy == 'interpolate':
+            df = df.interpolate(method='time', limit_direction='both')
+        else:
+            df = df.dropna()
+        
+        return df.fillna(0.0)
+    
+    def select_top_series(self, metrics_df: pd.DataFrame, k: int) -> pd.DataFrame:
+        """Keep the k series with the highest variance relative to their level"""
+        if metrics_df.shape[1] <= k:
+            return metrics_df
+        
+        matrix = metrics_df.to_numpy()
+        level = np.abs(np.median(matrix, axis=0))
+        relative_variance = matrix.var(axis=0) / np.where(level > 0, level, 1.0) ** 2
+        keep = np.sort(np.argpartition(relative_variance, -k)[-k:])
+        return metrics_df.iloc[:, keep]
+    
+    def fetch_metrics(self, metric_names: List[str], hours: float = 24, step_seconds: Optional[int] = None,
+                      gap_policy: Optional[str] = None, missing: Optional[List[str]] = None) -> pd.DataFrame:
+        """Fetch metrics from Prometheus API concurrently as a wide (time x series) matrix.
+        
+        Labeled metrics contribute one column per label set. Per-metric and
+        total series limits bound memory; above `top_k_series` columns only
+        the most variable series are kept. Metrics whose query failed or had
+        no data become zero columns and are appended to `missing` if given.
+        
+        Without an explicit step the resolution adapts to the window: series
+        are fetched at fetch_oversample x point_budget points (pre-aggregated
+        with <agg>_over_time) and LTTB-downsampled to point_budget points.
+        Ranges over query_max_points steps are split into sub-queries that run
+        in parallel with everything else.
+        """
+        try:
             end_time = datetime.now()
             start_time = end_time - timedelta(hours=hours)
+            start, end = start_time.timestamp(), end_time.timestamp()
             
-            # Query Prometheus API
-            prometheus_url = f"{self.prometheus_url}/api/v1/query_range"
+            if step_seconds is None:
+                output_step = self.choose_step(end - start, self.point_budget)
+                step_seconds = self.choose_step(end - start, self.point_budget * self.fetch_oversample)
+            else:
+                output_step = step_seconds
             
-            metrics_data = {}
-            timestamps = None
+            # All (metric, sub-range) queries in flight at once: wall-clock ~ slowest query
+            tasks = [(name, chunk) for name in metric_names for chunk in self.query_chunks(start, end, step_seconds)]
+            workers = max(1, min(len(tasks), self.fetch_concurrency))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                fetched = list(pool.map(lambda task: self.fetch_series(task[0], task[1][0], task[1][1], step_seconds), tasks))
             
-            for metric_name in metric_names:
-                try:
-                    # Build PromQL query
-                    query = metric_name
-                    
-                    params = {
-                        'query': query,
-                        'start': start_time.timestamp(),
-                        'end': end_time.timestamp(),
-                        'step': '1h'
-                    }
-                    
-                    response = requests.get(prometheus_url, params=params, timeout=10)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        
-                        if data.get('status') == 'success' and data.get('data', {}).get('result'):
-                            result = data['data']['result'][0]  # Get first result
-                            values = result.get('values', [])
-                            
-                            if values:
-                                # Extract timestamps and values
-                                if timestamps is None:
-                                    timestamps = [datetime.fromtimestamp(v[0]) for v in values]
-                                
-                                metric_values = [float(v[1]) for v in values]
-                                metrics_data[metric_name] = metric_values
-                        else:
-                            print(f"⚠️  No data for metric {metric_name}")
-                    else:
-                        print(f"⚠️  Prometheus API error for {metric_name}: {response.status_code}")
-                        
-                except Exception as e:
-                    print(f"⚠️  Error fetching {metric_name}: {e}")
-                    # Fallback to empty series
-                    if timestamps is None:
-                        timestamps = pd.date_range(start=start_time, end=end_time, freq='1H')
-                    metrics_data[metric_name] = [0] * len(timestamps)
+            by_metric: Dict[str, Optional[Dict[str, List[Tuple[np.ndarray, np.ndarray]]]]] = {name: None for name in metric_names}
+            for (metric_name, _), metric_series in zip(tasks, fetched):
+                if metric_series is None:
+                    continue
+                merged = by_metric[metric_name] if by_metric[metric_name] is not None else {}
+                for name, values in metric_series.items():
+                    merged.setdefault(name, []).append(values)
+                by_metric[metric_name] = merged
+            
+            series: Dict[str, Optional[Tuple[np.ndarray, np.ndarray]]] = {}
+            for metric_name, metric_series in by_metric.items():
+                if metric_series is None:
+                    series[metric_name] = None  # failed metric -> zero column
+                    if missing is not None:
+                        missing.append(metric_name)
+                    continue
+                for name, parts in metric_series.items():
+                    if len(series) >= self.max_series:
+                        break
+                    series[name] = (np.concatenate([ts for ts, _ in parts]), np.concatenate([v for _, v in parts]))
             
-            # If no data fetched, return empty DataFrame
-            if not metrics_data or timestamps is None:
-                timestamps = pd.date_range(start=start_time, end=end_time, freq='1H')
-                for metric_name in metric_names:
-                    if metric_name not in metrics_data:
-                        metrics_data[metric_name] = [0] * len(timestamps)
+            if len(series) >= self.max_series:
+                print(f"⚠️  Series cardinality limit reached ({self.max_series})")
             
-            df = pd.DataFrame(metrics_data, index=timestamps)
-            return df
+            metrics_df = self.align_series(series, start, end, step_seconds, gap_policy or self.gap_policy)
+            if output_step > step_seconds and not metrics_df.empty:
+                first = start - start % output_step
+                index = np.arange(first, end + 1, output_step, dtype=float)
+                # One bucket per output cell, so each kept point is within half
+                # a step of the grid time it is stored at (seasonal phases hold)
+                x = metrics_df.index.asi8 / 1e9
+                bounds = np.searchsorted(x, np.append(index - output_step / 2, np.inf))
+                bounds[0], bounds[-1] = 0, len(x)
+                if len(index) >= 3 and np.all(np.diff(bounds) > 0):
+                    downsampled = lttb(x, metrics_df.to_numpy(dtype=float), len(index), bounds)
+                    metrics_df = pd.DataFrame(downsampled, index=pd.to_datetime(index, unit='s'),
+                                              columns=metrics_df.columns)
+            return self.select_top_series(metrics_df, self.top_k_series)
         
         except Exception as e:
             print(f"⚠️  Error fetching metrics: {e}")
             return pd.DataFrame()
     
-    def detect_anomalies_isolation_forest(self, metrics_df: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Detect anomalies using IsolationForest"""
+    def load_model(self) -> bool:
+        """Load the registry's current model into the engine"""
+        try:
+            loaded = self.model_registry.load_current()
+            if loaded is None:
+                return False
+            self.isolation_forest, self.model_metadata = loaded
+            self.is_trained = True
+            return True
+        
+        except Exception as e:
+            print(f"⚠️  Model load error: {e}")
+            return False
+    
+    def isolation_forest_params(self) -> Dict[str, Any]:
+        """IsolationForest hyperparameters: tuned ones if a tuned config exists, else defaults"""
+        params = dict(DEFAULT_ISOLATION_FOREST_PARAMS)
+        try:
+            with open(self.tuned_config_path) as f:
+                tuned = json.load(f).get('isolation_forest', {}).get('params', {})
+            params.update({key: tuned[key] for key in params if key in tuned})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Tuned config error, using default hyperparameters: {e}")
+        return params
+    
+    def align_features(self, metrics_df: pd.DataFrame,
+                       metadata: Optional[Dict[str, Any]] = None) -> Optional[pd.DataFrame]:
+        """Reindex data onto the model's feature columns, or None if too few overlap"""
+        metadata = self.model_metadata if metadata is None else metadata
+        columns = metadata.get('feature_columns', [])
+        if not columns:
+            return None
+        overlap = len(set(columns) & set(metrics_df.columns)) / len(columns)
+        if overlap < self.min_feature_overlap:
+            return None
+        # Missing series are filled with their training mean (a neutral value)
+        fill = dict(zip(columns, metadata['feature_mean']))
+        return metrics_df.reindex(columns=columns).fillna(fill)
+    
+    def retrain_reason(self, metrics_df: pd.DataFrame, now: Optional[datetime] = None) -> Optional[str]:
+        """Why the current model must be retrained for this data, or None.
+        
+        The retrain schedule is checked at `now` (wall clock by default;
+        replay passes the end of the replayed window).
+        """
+        if not self.is_trained and not self.load_model():
+            return 'no_model'
+        
+        metadata = self.model_metadata
+        if metadata.get('sklearn_version') != sklearn.__version__:
+            return 'sklearn_version'
+        if metadata.get('feature_pipeline') != self.feature_config():
+            return 'feature_pipeline'
+        if metadata.get('isolation_forest_params', DEFAULT_ISOLATION_FOREST_PARAMS) != self.isolation_forest_params():
+            return 'tuned_params'
+        if self.align_features(metrics_df) is None:
+            return 'feature_columns'
+        
+        trained_at = datetime.fromisoformat(metadata['trained_at'])
+        if (now or datetime.now()) - trained_at > timedelta(hours=self.retrain_hours):
+            return 'schedule'
+        
+        # Drift: largest standardized shift of a feature mean since training,
+        # or a feature whose rows leave the training range too often (a mean
+        # shift misses a feature that only trends out at the newest rows)
+        features = self.align_features(metrics_df).to_numpy()
+        train_mean = np.asarray(metadata['feature_mean'])
+        train_std = np.asarray(metadata['feature_std'])
+        shift = np.abs(features.mean(axis=0) - train_mean) / np.where(train_std > 0, train_std, 1.0)
+        if shift.size and shift.max() > self.drift_threshold:
+            return 'drift'
+        if 'feature_min' in metadata and features.size:
+            outside = (features < np.asarray(metadata['feature_min'])) | (features > np.asarray(metadata['feature_max']))
+            if outside.mean(axis=0).max() > self.range_drift_fraction:
+                return 'drift'
+        
+        return None
+    
+    def train_and_promote(self, metrics_df: pd.DataFrame, reason: str, now: Optional[datetime] = None) -> int:
+        """Fit a new IsolationForest, register it and promote it (as trained at `now`)"""
+        params = self.isolation_forest_params()
+        model = IsolationForest(**params, random_state=42)
+        model.fit(metrics_df)
+        
+        matrix = metrics_df.to_numpy(dtype=float)
+        metadata = {
+            'trained_at': (now or datetime.now()).isoformat(),
+            'training_window': [metrics_df.index[0].isoformat(), metrics_df.index[-1].isoformat()],
+            'feature_columns': list(map(str, metrics_df.columns)),
+            'feature_mean': matrix.mean(axis=0).tolist(),
+            'feature_std': matrix.std(axis=0).tolist(),
+            'feature_min': matrix.min(axis=0).tolist(),
+            'feature_max': matrix.max(axis=0).tolist(),
+            'sklearn_version': sklearn.__version__,
+            'feature_pipeline': self.feature_config(),
+            'isolation_forest_params': params,
+            'data_fingerprint': data_fingerprint(metrics_df),
+            'reason': reason,
+        }
+        version = self.model_registry.register(model, metadata)
+        self.model_registry.promote(version)
+        self.model_registry.prune(self.model_versions_kept)
+        
+        self.isolation_forest = model
+        self.model_metadata = {**metadata, 'version': version}
+        self.is_trained = True
+        print(f"🧠 Trained IsolationForest v{version} ({reason})")
+        return version
+    
+    def feature_config(self) -> Dict[str, Any]:
+        return {'kinds': list(self.feature_kinds), 'window': self.feature_window, 'ewma_alpha': self.feature_ewma_alpha}
+    
+    def feature_pipeline(self, series: List[str]) -> FeaturePipeline:
+        """Feature pipeline for a set of series, configured from the environment"""
+        return FeaturePipeline(series, self.feature_kinds, self.feature_window, self.feature_ewma_alpha)
+    
+    def window_features(self, metrics_df: pd.DataFrame,
+                        previous: Optional[Tuple[FeaturePipeline, pd.DataFrame]] = None
+                        ) -> Tuple[FeaturePipeline, pd.DataFrame]:
+        """Pipeline and features for `metrics_df`, advancing `previous` where possible.
+        
+        When `previous` was built for the same series and feature settings
+        and its last row lies in `metrics_df`, only the newer rows go through
+        `update` (on a copy, so readers of `previous` are unaffected) and rows
+        older than the window are dropped. Otherwise (cold start, a changed
+        configuration or a gap) the whole window is backfilled.
+        """
+        fresh = self.feature_pipeline(list(metrics_df.columns))
+        if previous is not None:
+            pipeline, features = previous
+            same_config = (pipeline.columns == fresh.columns and pipeline.window == fresh.window
+                           and pipeline.alpha == fresh.alpha)
+            if same_config and len(features) and features.index[-1] in metrics_df.index:
+                new_rows = metrics_df.loc[metrics_df.index > features.index[-1]]
+                pipeline = copy.deepcopy(pipeline)
+                timestamps = new_rows.index.asi8 / 1e9
+                rows = [pipeline.update(values, timestamp)
+                        for values, timestamp in zip(new_rows[pipeline.series].to_numpy(dtype=float), timestamps)]
+                if rows:
+                    features = pd.concat([features, pd.DataFrame(rows, index=new_rows.index, columns=pipeline.columns)])
+                if metrics_df.index.isin(features.index).all():
+                    return pipeline, features.loc[metrics_df.index]
+        return fresh, fresh.backfill(metrics_df)
+    
+    def detect_anomalies_isolation_forest(self, metrics_df: pd.DataFrame,
+                                          now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Detect anomalies using IsolationForest (retrain schedule checked at `now`)"""
         anomalies = []
         
         try:
             if metrics_df.empty or len(metrics_df) < 10:
                 return anomalies
             
-            # Fit IsolationForest
-            if not self.is_trained:
-                self.isolation_forest.fit(metrics_df)
-                self.is_trained = True
+            self.feature_state = self.window_features(metrics_df, self.feature_state)
+            features = self.feature_state[1]
             
-            # Predict anomalies
-            predictions = self.isolation_forest.predict(metrics_df)
-            anomaly_scores = self.isolation_forest.score_samples(metrics_df)
+            # Reuse the registry's model; refit only on schedule, drift or schema change
+            reason = self.retrain_reason(features, now)
+            if reason is not None:
+                self.train_and_promote(features, reason, now)
             
-            # Identify anomalous points
-            for idx, (timestamp, prediction, score) in enumerate(zip(metrics_df.index, predictions, anomaly_scores)):
-                if prediction == -1:  # Anomaly detected
-                    anomalies.append({
-                        'timestamp': timestamp.isoformat(),
-                        'metric_values': metrics_df.iloc[idx].to_dict(),
-                        'anomaly_score': float(score),
-                        'severity': 'high' if score < -0.5 else 'medium'
-                    })
+            center, scale = robust_center_scale(metrics_df.to_numpy())
+            anomalies = self.score_rows(metrics_df, center, scale, features)
         
         except Exception as e:
             print(f"⚠️  Anomaly detection error: {e}")
         
         return anomalies
     
-    def cross_correlation_analysis(self, metrics_df: pd.DataFrame) -> Dict[str, float]:
-        """Analyze cross-correlation between metrics"""
-        correlations = {}
+    def score_rows(self, rows_df: pd.DataFrame, center: np.ndarray,
+                   scale: np.ndarray, features_df: Optional[pd.DataFrame] = None,
+                   model: Optional[IsolationForest] = None,
+                   metadata: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Anomalies among `rows_df` under the loaded model (no retraining).
+        
+        The model scores `features_df` (rows_df itself if not given); each
+        anomalous timestamp is attributed to the raw series (at most
+        anomaly_top_series) whose robust z-score against the given per-column
+        center and scale reaches attribution_zscore, or to the single most
+        deviant series when none does. Pass
+        `model` and `metadata` to score with a captured model rather than the
+        engine's current one.
+        """
+        anomalies = []
+        model = self.isolation_forest if model is None else model
+        features = self.align_features(rows_df if features_df is None else features_df, metadata)
+        if features is None:
+            return anomalies
+        predictions = model.predict(features)
+        anomaly_scores = model.score_samples(features)
+        
+        matrix = rows_df.to_numpy()
+        zscores = np.abs((matrix - center) / scale)
+        columns = rows_df.columns
+        top_n = min(self.anomaly_top_series, len(columns))
+        
+        # High severity is measured past the model's own threshold (offset_),
+        # which moves with contamination, rather than at a fixed score
+        high_cutoff = model.offset_ - self.high_severity_margin
+        
+        # Identify anomalous points
+        for idx in np.flatnonzero(predictions == -1):
+            top = np.argpartition(zscores[idx], -top_n)[-top_n:]
+            top = top[np.argsort(-zscores[idx, top])]
+            top = top[:max(1, int(np.sum(zscores[idx, top] >= self.attribution_zscore)))]
+            score = anomaly_scores[idx]
+            anomalies.append({
+                'timestamp': rows_df.index[idx].isoformat(),
+                'metric_values': {columns[j]: float(matrix[idx, j]) for j in top},
+                'series_zscores': {columns[j]: float(zscores[idx, j]) for j in top},
+                'anomaly_score': float(score),
+                'severity': 'high' if score < high_cutoff else 'medium'
+            })
+        
+        return anomalies
+    
+    def detect_seasonal_anomalies(self, metrics_df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Anomalies in the decision horizon by MAD z-score of seasonal-baseline residuals"""
+        anomalies = []
         
+        try:
+            if metrics_df.empty or len(metrics_df) < 10:
+                return anomalies
+            
+            timestamps = metrics_df.index.asi8 / 1e9
+            step_seconds = float(np.median(np.diff(timestamps)))
+            periods = [SEASONAL_PERIODS[name] for name in self.seasonal_periods]
+            matrix = metrics_df.to_numpy(dtype=float)
+            residuals = seasonal_residuals(matrix, timestamps, step_seconds, periods)
+            
+            # Residual median/MAD from at most ~256 evenly spread rows; only the horizon is scored
+            center, scale = robust_center_scale(residuals[::max(1, len(residuals) // 256)])
+            cutoff = metrics_df.index[-1] - pd.Timedelta(minutes=self.decision_horizon_minutes)
+            horizon = np.flatnonzero(metrics_df.index > cutoff)
+            zscores = np.zeros_like(residuals)
+            zscores[horizon] = np.abs((residuals[horizon] - center) / scale)
+            
+            columns = metrics_df.columns
+            for idx in horizon[zscores[horizon].max(axis=1) >= self.seasonal_threshold]:
+                flagged = np.flatnonzero(zscores[idx] >= self.seasonal_threshold)
+                flagged = flagged[np.argsort(-zscores[idx, flagged])][:self.anomaly_top_series]
+                anomalies.append({
+                    'timestamp': metrics_df.index[idx].isoformat(),
+                    'metric_values': {columns[j]: float(matrix[idx, j]) for j in flagged},
+                    'series_zscores': {columns[j]: float(zscores[idx, j]) for j in flagged},
+                    'detector': 'seasonal',
+                    'severity': 'high' if zscores[idx].max() >= 2 * self.seasonal_threshold else 'medium'
+                })
+        
+        except Exception as e:
+            print(f"⚠️  Seasonal anomaly detection error: {e}")
+        
+        return anomalies
+    
+    def lagged_correlations(self, metrics_df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Top-k metric pairs by lagged cross-correlation, with their best lag"""
         try:
             if metrics_df.empty or metrics_df.shape[1] < 2:
-                return correlations
+                return []
             
-            # Calculate correlation matrix
-            corr_matrix = metrics_df.corr()
+            step_seconds = None
+            if isinstance(metrics_df.index, pd.DatetimeIndex) and len(metrics_df.index) > 1:
+                step_seconds = float(np.median(np.diff(metrics_df.index.asi8))) / 1e9
+            max_lag = int(self.correlation_max_lag_seconds // step_seconds) if step_seconds else 0
             
-            # Extract top correlations
-            for i in range(len(corr_matrix.columns)):
-                for j in range(i+1, len(corr_matrix.columns)):
-                    metric1 = corr_matrix.columns[i]
-                    metric2 = corr_matrix.columns[j]
-                    corr_value = corr_matrix.iloc[i, j]
-                    
-                    correlations[f"{metric1}__{metric2}"] = float(corr_value)
+            matrix = metrics_df.to_numpy(dtype=float)
+            pairs = lagged_cross_correlations(np.nan_to_num(matrix), max_lag, self.correlation_top_k)
+            columns = metrics_df.columns
+            return [
+                {
+                    'metric1': str(columns[i]),
+                    'metric2': str(columns[j]),
+                    'correlation': corr,
+                    'lag_steps': lag,
+                    'lag_seconds': lag * step_seconds if step_seconds else None,
+                    'leader': str(columns[i] if lag >= 0 else columns[j])
+                }
+                for corr, i, j, lag in pairs
+            ]
+        
+        except Exception as e:
+            print(f"⚠️  Lagged correlation error: {e}")
+            return []
+    
+    def cross_correlation_analysis(self, metrics_df: pd.DataFrame) -> Dict[str, float]:
+        """Same-time (zero-lag) correlation of the top-k metric pairs.
+        
+        These feed the risk score. The best of up to 2 * max_lag + 1 lagged
+        correlations is biased upwards by chance, so lagged_correlations is
+        only used to relate series (incident grouping) and reported apart.
+        """
+        try:
+            if metrics_df.empty or metrics_df.shape[1] < 2:
+                return {}
+            matrix = np.nan_to_num(metrics_df.to_numpy(dtype=float))
+            columns = metrics_df.columns
+            return {f"{columns[i]}__{columns[j]}": corr
+                    for corr, i, j, _ in lagged_cross_correlations(matrix, 0, self.correlation_top_k)}
         
         except Exception as e:
             print(f"⚠️  Correlation analysis error: {e}")
+            return {}
+    
+    def horizon_rows(self, index: pd.DatetimeIndex) -> int:
+        """Rows of `index` inside the decision horizon before its last timestamp"""
+        if len(index) == 0:
+            return 0
+        return int((index > index[-1] - pd.Timedelta(minutes=self.decision_horizon_minutes)).sum())
+    
+    def expected_anomalies(self, rows: int, model: Optional[IsolationForest] = None) -> float:
+        """IsolationForest flags expected by chance among `rows` scored rows.
         
-        return correlations
+        The model flags its contamination share of normal data, so this is
+        the count at which anomalies carry no evidence by themselves.
+        """
+        contamination = (self.isolation_forest if model is None else model).contamination
+        if not isinstance(contamination, (int, float)):
+            contamination = DEFAULT_ISOLATION_FOREST_PARAMS['contamination']
+        return float(contamination) * rows
+    
+    def row_risk(self, anomaly_score: float, model: Optional[IsolationForest] = None) -> float:
+        """Risk of one scored row on its own: 0 up to the model's threshold,
+        0.5 at the high-severity cutoff, 1 at twice that distance past it"""
+        past = (self.isolation_forest if model is None else model).offset_ - anomaly_score
+        return float(np.clip(past / (2 * self.high_severity_margin), 0.0, 1.0))
+    
+    def recent_anomalies(self, anomalies: List[Dict], window_end: pd.Timestamp) -> List[Dict]:
+        """Anomalies within the decision horizon before `window_end`; the rest
+        of the window only serves as the baseline"""
+        cutoff = window_end - pd.Timedelta(minutes=self.decision_horizon_minutes)
+        return [a for a in anomalies if pd.Timestamp(a['timestamp']) > cutoff]
+    
+    def group_incidents(self, anomalies: List[Dict],
+                        lagged: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge anomalies across series and time into incidents.
+        
+        Correlated series (|r| at best lag >= incident_min_correlation) form
+        series clusters. Each anomaly lands in a (time bucket, cluster) node per
+        series it names; nodes of one anomaly are joined, and each node joins
+        the same cluster's node in the previous bucket. Union-find keeps this
+        near-linear in the number of anomaly points.
+        """
+        clusters = UnionFind()
+        for pair in lagged:
+            if abs(pair['correlation']) >= self.incident_min_correlation:
+                clusters.union(pair['metric1'], pair['metric2'])
+        
+        cluster_of = {name: clusters.find(name) for name in list(clusters.parent)}
+        
+        bucket_seconds = self.incident_window_minutes * 60
+        nodes = UnionFind()
+        members: Dict[Tuple[int, Any], List[int]] = {}
+        seconds = pd.to_datetime([anomaly['timestamp'] for anomaly in anomalies]).asi8 // 10**9
+        buckets = (seconds // bucket_seconds).astype(np.int64).tolist()
+        for position, (anomaly, bucket) in enumerate(zip(anomalies, buckets)):
+            keys = [(bucket, cluster_of.get(name, name)) for name in anomaly.get('series_zscores', {})] or [(bucket, position)]
+            for key in keys:
+                nodes.add(key)
+                nodes.union(keys[0], key)
+                members.setdefault(key, []).append(position)
+        for bucket, cluster in list(members):
+            if (bucket - 1, cluster) in members:
+                nodes.union((bucket, cluster), (bucket - 1, cluster))
+        
+        grouped: Dict[Any, set] = {}
+        for key, positions in members.items():
+            grouped.setdefault(nodes.find(key), set()).update(positions)
+        
+        incidents = []
+        for positions in grouped.values():
+            items = [anomalies[position] for position in sorted(positions)]
+            zscores: Dict[str, float] = {}
+            for item in items:
+                for name, zscore in item.get('series_zscores', {}).items():
+                    zscores[name] = max(zscores.get(name, 0.0), zscore)
+            timestamps = sorted(item['timestamp'] for item in items)
+            incidents.append({
+                'start': timestamps[0],
+                'end': timestamps[-1],
+                'anomalies': items,
+                'series': sorted(zscores, key=lambda name: -zscores[name])[:self.anomaly_top_series],
+                'max_zscore': max(zscores.values(), default=0.0),
+                'severity': 'high' if any(item.get('severity') == 'high' for item in items) else 'medium'
+            })
+        return sorted(incidents, key=lambda incident: incident['start'])
+    
+    def alert_episodes(self, anomalies: List[Dict]) -> int:
+        """Alerts per-series alerting would raise for these anomalies.
+        
+        One alert per series per episode: a run of consecutive incident
+        windows in which the series is flagged. This is what group_incidents
+        replaces, and unlike the raw anomaly count it does not grow with how
+        many points the detector flags per episode.
+        """
+        bucket_seconds = self.incident_window_minutes * 60
+        seconds = pd.to_datetime([anomaly['timestamp'] for anomaly in anomalies]).asi8 // 10**9
+        buckets = (seconds // bucket_seconds).astype(np.int64).tolist()
+        flagged = set()
+        for position, (anomaly, bucket) in enumerate(zip(anomalies, buckets)):
+            flagged.update((name, bucket) for name in anomaly.get('series_zscores', {}) or [position])
+        return sum((name, bucket - 1) not in flagged for name, bucket in flagged)
+    
+    def decide_incidents(self, incidents: List[Dict[str, Any]], correlations: Dict[str, float],
+                         window_end: pd.Timestamp, step_seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """One decision per incident still active in the decision horizon.
+        
+        With `step_seconds`, an incident's anomaly count is judged against the
+        chance flags expected over the rows its time span covers.
+        """
+        cutoff = window_end - pd.Timedelta(minutes=self.decision_horizon_minutes)
+        for incident in incidents:
+            incident['active'] = pd.Timestamp(incident['end']) > cutoff
+            incident['risk_score'] = None
+            incident['decision'] = None
+            if incident['active']:
+                series = set(incident['series'])
+                related = {pair: value for pair, value in correlations.items()
+                           if set(pair.split('__', 1)) <= series}
+                expected = None
+                if step_seconds:
+                    span = (pd.Timestamp(incident['end']) - pd.Timestamp(incident['start'])).total_seconds()
+                    expected = self.expected_anomalies(int(span // step_seconds) + 1)
+                incident['risk_score'] = self.calculate_risk_score(incident['anomalies'], related,
+                                                                   expected_anomalies=expected)
+                incident['decision'] = self.make_decision(incident['risk_score'], incident['anomalies'])
+        return incidents
     
     def calculate_risk_score(self, anomalies: List[Dict], 
-                            correlations: Dict[str, float]) -> float:
-        """Calculate unified risk score"""
+                            correlations: Dict[str, float],
+                            seasonal_anomalies: Optional[List[Dict]] = None,
+                            expected_anomalies: Optional[float] = None) -> float:
+        """Calculate unified risk score.
+        
+        For IsolationForest anomalies pass `expected_anomalies` (see
+        expected_anomalies()): count risk then grows with the excess over
+        that chance level, reaching 1 at anomaly_excess_factor times it.
+        Without it (fixed z-score detectors) fixed scales apply.
+        """
         try:
-            # Base risk from anomaly count
-            anomaly_risk = min(len(anomalies) / 10.0, 1.0)  # Normalize to 0-1
-            
-            # High-severity anomaly risk
             high_severity_count = sum(1 for a in anomalies if a.get('severity') == 'high')
-            severity_risk = min(high_severity_count / 5.0, 1.0)
+            if expected_anomalies is None:
+                # Base risk from anomaly count, high-severity anomaly risk
+                anomaly_risk = min(len(anomalies) / 10.0, 1.0)  # Normalize to 0-1
+                severity_risk = min(high_severity_count / 5.0, 1.0)
+            else:
+                expected = max(expected_anomalies, 1.0)
+                excess = (len(anomalies) / expected - 1.0) / (self.anomaly_excess_factor - 1.0)
+                anomaly_risk = float(np.clip(excess, 0.0, 1.0))
+                severity_risk = min(high_severity_count / expected, 1.0)
             
             # Correlation risk (high correlation might indicate issue)
             strong_corr_count = sum(1 for v in correlations.values() if abs(v) > 0.8)
@@ -187,6 +1475,12 @@ class AIOpsDecisionEngine:
                 0.2 * correlation_risk
             )
             
+            # Seasonal-baseline deviations, when that detector ran
+            if seasonal_anomalies is not None:
+                seasonal_series = {name for a in seasonal_anomalies for name in a.get('series_zscores', {})}
+                seasonal_risk = min(len(seasonal_series) / 5.0, 1.0)
+                risk_score = 0.75 * risk_score + 0.25 * seasonal_risk
+            
             return min(risk_score, 1.0)
         
         except Exception as e:
@@ -239,11 +1533,12 @@ class AIOpsDecisionEngine:
         
         return decision
     
-    def export_metrics_to_prometheus(self, risk_score: float, 
+    def export_metrics_to_prometheus(self, risk_score: Optional[float] = None, 
                                      prediction_accuracy: float = 0.0):
         """Export metrics to Prometheus"""
         try:
-            self.risk_score.set(risk_score)
+            if risk_score is not None:
+                self.risk_score.set(risk_score)
             if prediction_accuracy > 0:
                 self.prediction_accuracy.set(prediction_accuracy)
             
@@ -261,15 +1556,7 @@ class AIOpsDecisionEngine:
         print("🔍 Starting AIOps Decision Engine Analysis...")
         
         # Fetch metrics
-        metric_names = [
-            'cpt_seo_rank_drift_score',
-            'cpt_seo_position_delta',
-            'cpt_keyword_visibility_index',
-            'cpt_aiops_risk_score',
-            'http_requests_total'
-        ]
-        
-        metrics_df = self.fetch_metrics(metric_names, hours=24)
+        metrics_df = self.fetch_metrics(self.metric_names, hours=24)
         
         if metrics_df.empty:
             print("❌ No metrics available")
@@ -281,13 +1568,33 @@ class AIOpsDecisionEngine:
         
         # Cross-correlation analysis
         print("📊 Analyzing cross-correlations...")
+        lagged_correlations = self.lagged_correlations(metrics_df)
         correlations = self.cross_correlation_analysis(metrics_df)
         
+        # Seasonal baseline over a longer, coarser history
+        print("📅 Checking seasonal baselines...")
+        seasonal_anomalies = self.detect_seasonal_anomalies(
+            self.fetch_metrics(self.metric_names, hours=self.seasonal_days * 24))
+        
         # Calculate risk score
-        risk_score = self.calculate_risk_score(anomalies, correlations)
+        recent = self.recent_anomalies(anomalies, metrics_df.index[-1])
+        expected = self.expected_anomalies(self.horizon_rows(metrics_df.index))
+        risk_score = self.calculate_risk_score(recent, correlations, seasonal_anomalies, expected)
         
         # Make decision
-        decision = self.make_decision(risk_score, anomalies)
+        decision = self.make_decision(risk_score, recent)
+        
+        # Group anomalies into incidents, one decision per active incident
+        print("🧩 Grouping anomalies into incidents...")
+        all_anomalies = anomalies + seasonal_anomalies
+        incidents = self.group_incidents(all_anomalies, lagged_correlations)
+        step_seconds = float(np.median(np.diff(metrics_df.index.asi8))) / 1e9 if len(metrics_df) > 1 else None
+        incidents = self.decide_incidents(incidents, correlations, metrics_df.index[-1], step_seconds)
+        
+        # Alerts per-series alerting would have raised (one per series episode) vs incidents raised
+        alert_episodes = self.alert_episodes(all_anomalies)
+        alert_reduction = 100.0 * (1 - len(incidents) / alert_episodes) if alert_episodes else 0.0
+        self.alert_reduction.set(alert_reduction)
         
         # Export to Prometheus
         self.export_metrics_to_prometheus(risk_score)
@@ -295,22 +1602,838 @@ class AIOpsDecisionEngine:
         # Print summary
         print(f"\n📈 AIOps Analysis Summary:")
         print(f"   Anomalies detected: {len(anomalies)}")
+        print(f"   Seasonal anomalies: {len(seasonal_anomalies)}")
+        print(f"   Incidents: {len(incidents)} ({sum(i['active'] for i in incidents)} active, "
+              f"{alert_episodes} per-series alerts, reduction {alert_reduction:.1f}%)")
         print(f"   Risk score: {risk_score:.2f}")
         print(f"   Decision: {decision['action']} (confidence: {decision['confidence']:.2f})")
         print(f"   Reason: {decision['reason']}")
         
         return {
             'anomalies': anomalies,
+            'seasonal_anomalies': seasonal_anomalies,
+            'incidents': incidents,
+            'alert_episodes': alert_episodes,
+            'alert_reduction_percentage': alert_reduction,
             'correlations': correlations,
+            'lagged_correlations': lagged_correlations,
             'risk_score': risk_score,
             'decision': decision,
             'timestamp': datetime.now().isoformat()
         }
 
 
+def replay_windows(metrics_df: pd.DataFrame, window_rows: int,
+                   end_positions: List[int]) -> List[Dict[str, Any]]:
+    """Run the batch decision path on each window ending at `end_positions`.
+
+    Worker for ReplayHarness: uses its own engine and a throwaway model
+    registry, so chunks in different processes never share model state.
+    """
+    engine = AIOpsDecisionEngine()
+    engine.model_registry = ModelRegistry(tempfile.mkdtemp(prefix='aiops-replay-'))
+    results = []
+    try:
+        for end in end_positions:
+            window = metrics_df.iloc[end - window_rows + 1:end + 1]
+            started = time.perf_counter()
+            # Replayed time, so the retrain schedule follows the history
+            anomalies = engine.detect_anomalies_isolation_forest(window, window.index[-1].to_pydatetime())
+            correlations = engine.cross_correlation_analysis(window)
+            recent = engine.recent_anomalies(anomalies, window.index[-1])
+            expected = engine.expected_anomalies(engine.horizon_rows(window.index))
+            risk_score = engine.calculate_risk_score(recent, correlations, expected_anomalies=expected)
+            decision = engine.make_decision(risk_score, recent)
+            results.append({
+                'window_end': window.index[-1],
+                'action': decision['action'],
+                'risk_score': risk_score,
+                'anomalies': len(recent),
+                'latency_seconds': time.perf_counter() - started
+            })
+    finally:
+        shutil.rmtree(engine.model_registry.root, ignore_errors=True)
+    return results
+
+
+class ReplayHarness:
+    """Historical replay of the decision engine against labeled incidents.
+
+    History is recorded Prometheus range-query JSON (one file or a directory
+    of them) or Parquet (wide: time index/`timestamp` column x series, or long:
+    timestamp/series/value). The engine slides a window over it in parallel
+    chunks across processes; decisions other than 'none' count as positives.
+    """
+
+    def __init__(self, engine: AIOpsDecisionEngine):
+        self.engine = engine
+        self.window_hours = float(os.getenv('AIOPS_REPLAY_WINDOW_HOURS', '24'))
+        self.stride_steps = int(os.getenv('AIOPS_REPLAY_STRIDE_STEPS', '1'))
+        self.workers = int(os.getenv('AIOPS_REPLAY_WORKERS', str(os.cpu_count() or 1)))
+        self.chunk_windows = int(os.getenv('AIOPS_REPLAY_CHUNK_WINDOWS', '250'))
+    
+    def load_history(self, path: str) -> pd.DataFrame:
+        """Recorded metrics as a step-aligned (time x series) matrix"""
+        if os.path.isdir(path):
+            paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if name.endswith(('.json', '.parquet')))
+        else:
+            paths = [path]
+        
+        frames, series = [], {}
+        for file_path in paths:
+            if file_path.endswith('.parquet'):
+                frames.append(self._read_parquet(file_path))
+                continue
+            with open(file_path) as f:
+                data = json.load(f)
+            for item in data.get('data', {}).get('result', []):
+                raw = np.asarray(item.get('values', []), dtype=float)
+                if raw.size:
+                    labels = item.get('metric', {})
+                    series[series_name(labels.get('__name__', 'value'), labels)] = (raw[:, 0], raw[:, 1])
+        
+        if series:
+            timestamps = np.concatenate([ts for ts, _ in series.values()])
+            steps = np.concatenate([np.diff(np.unique(ts)) for ts, _ in series.values()])
+            step_seconds = int(np.median(steps)) if steps.size else 60
+            frames.append(self.engine.align_series(series, timestamps.min(), timestamps.max(),
+                                                   step_seconds, self.engine.gap_policy))
+        if not frames:
+            raise ValueError(f'No metric history found in {path}')
+        
+        metrics_df = pd.concat(frames, axis=1).sort_index()
+        metrics_df = metrics_df.loc[:, ~metrics_df.columns.duplicated()]
+        return self.engine.select_top_series(metrics_df.ffill().bfill().fillna(0.0), self.engine.top_k_series)
+    
+    def _read_parquet(self, path: str) -> pd.DataFrame:
+        df = pd.read_parquet(path)
+        if {'timestamp', 'series', 'value'} <= set(df.columns):
+            df = df.pivot_table(index='timestamp', columns='series', values='value', aggfunc='last')
+        elif 'timestamp' in df.columns:
+            df = df.set_index('timestamp')
+        if not isinstance(df.index, pd.DatetimeIndex):
+            df.index = pd.to_datetime(df.index, unit='s') if np.issubdtype(df.index.dtype, np.number) else pd.to_datetime(df.index)
+        if df.index.tz is not None:
+            df.index = df.index.tz_convert('UTC').tz_localize(None)
+        return df.astype(float)
+    
+    def load_incidents(self, path: str) -> pd.DataFrame:
+        """Labeled incidents with `start` and `end` columns (JSON list or CSV)"""
+        if path.endswith('.csv'):
+            incidents = pd.read_csv(path)
+        else:
+            with open(path) as f:
+                incidents = pd.DataFrame(json.load(f))
+        for column in ('start', 'end'):
+            values = pd.to_datetime(incidents[column], utc=True)
+            incidents[column] = values.dt.tz_localize(None)
+        return incidents.sort_values('start').reset_index(drop=True)
+    
+    def replay(self, metrics_df: pd.DataFrame) -> pd.DataFrame:
+        """Decisions for every window position, computed in parallel chunks"""
+        step_seconds = float(np.median(np.diff(metrics_df.index.asi8))) / 1e9
+        window_rows = max(10, int(self.window_hours * 3600 / step_seconds))
+        ends = list(range(window_rows - 1, len(metrics_df), self.stride_steps))
+        if not ends:
+            raise ValueError(f'History has {len(metrics_df)} steps, fewer than one {window_rows}-step window')
+        
+        # Each chunk ships only the rows its windows cover
+        chunks = [ends[i:i + self.chunk_windows] for i in range(0, len(ends), self.chunk_windows)]
+        jobs = [(metrics_df.iloc[chunk[0] - window_rows + 1:chunk[-1] + 1], window_rows,
+                 [end - (chunk[0] - window_rows + 1) for end in chunk]) for chunk in chunks]
+        
+        with ProcessPoolExecutor(max_workers=max(1, min(self.workers, len(jobs)))) as pool:
+            futures = [pool.submit(replay_windows, *job) for job in jobs]
+            results = [row for future in futures for row in future.result()]
+        return pd.DataFrame(results)
+    
+    def evaluate(self, decisions: pd.DataFrame, incidents: Optional[pd.DataFrame]) -> Dict[str, Any]:
+        """Precision over positive windows and recall over incidents"""
+        positive = decisions['action'] != 'none'
+        report: Dict[str, Any] = {
+            'windows': int(len(decisions)),
+            'positive_windows': int(positive.sum()),
+            'decision_latency_ms': {
+                'mean': float(decisions['latency_seconds'].mean() * 1000),
+                'p95': float(decisions['latency_seconds'].quantile(0.95) * 1000)
+            }
+        }
+        if incidents is None or incidents.empty:
+            return report
+        
+        ends = decisions['window_end'].to_numpy(dtype='datetime64[ns]')
+        starts = incidents['start'].to_numpy(dtype='datetime64[ns]')
+        stops = incidents['end'].to_numpy(dtype='datetime64[ns]')
+        # Incident covering each window end, via the last incident starting before it
+        candidate = np.searchsorted(starts, ends, side='right') - 1
+        in_incident = (candidate >= 0) & (ends <= stops[np.maximum(candidate, 0)])
+        
+        true_positive = int((positive & in_incident).sum())
+        detected, delays = 0, []
+        for start, stop in zip(starts, stops):
+            hits = ends[positive.to_numpy() & (ends >= start) & (ends <= stop)]
+            if hits.size:
+                detected += 1
+                delays.append(float((hits.min() - start) / np.timedelta64(1, 's')))
+        
+        report.update({
+            'incidents': int(len(incidents)),
+            'incidents_detected': detected,
+            'precision': true_positive / max(int(positive.sum()), 1),
+            'recall': detected / len(incidents),
+            'false_positive_windows': int((positive & ~in_incident).sum()),
+            'false_positive_rate': int((positive & ~in_incident).sum()) / max(int((~in_incident).sum()), 1),
+            'mean_detection_delay_seconds': float(np.mean(delays)) if delays else None
+        })
+        return report
+    
+    def run(self, history_path: str, incidents_path: Optional[str] = None) -> Dict[str, Any]:
+        started = time.time()
+        metrics_df = self.load_history(history_path)
+        incidents = self.load_incidents(incidents_path) if incidents_path else None
+        print(f"⏪ Replaying {metrics_df.shape[1]} series over {len(metrics_df)} steps "
+              f"({metrics_df.index[0]} → {metrics_df.index[-1]})")
+        
+        decisions = self.replay(metrics_df)
+        elapsed = time.time() - started
+        report = self.evaluate(decisions, incidents)
+        report.update({
+            'series': int(metrics_df.shape[1]),
+            'elapsed_seconds': elapsed,
+            'windows_per_second': len(decisions) / elapsed if elapsed > 0 else None,
+            'workers': self.workers
+        })
+        return report
+
+
+class TenantAnalyzer:
+    """Per-organization analysis for the multi-tenant platform.
+
+    Every tenant gets its own label-filtered query set (fetched concurrently,
+    over the engine's shared HTTP session) and its own risk score and decision.
+    Tenants share one warm IsolationForest: series names drop the tenant label
+    and features are standardized per tenant, so the model is trained once on
+    the pooled tenants and reused for all of them. The engine passed in is
+    dedicated to this mode (its registry points at the tenant model dir).
+    """
+
+    def __init__(self, engine: AIOpsDecisionEngine):
+        self.engine = engine
+        self.tenant_label = os.getenv('AIOPS_TENANT_LABEL', 'organization_id')
+        self.concurrency = int(os.getenv('AIOPS_TENANT_CONCURRENCY', '8'))
+        self.max_train_rows = int(os.getenv('AIOPS_TENANT_TRAIN_ROWS', '20000'))
+        self.hours = float(os.getenv('AIOPS_TENANT_WINDOW_HOURS', '24'))
+        self.tenants = [tenant for tenant in os.getenv('AIOPS_TENANTS', '').split(',') if tenant]
+        engine.model_registry = ModelRegistry(os.getenv(
+            'AIOPS_TENANT_MODEL_DIR', os.path.join(engine.model_registry.root, 'tenants')))
+        
+        # Every tenant worker runs its own fetch pool over the one session
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=engine.fetch_concurrency * self.concurrency)
+        engine.session.mount('http://', adapter)
+        engine.session.mount('https://', adapter)
+        self.tenant_risk = Gauge('cpt_aiops_tenant_risk_score', 'Unified AIOps risk score per tenant (0-1)',
+                                 [self.tenant_label], registry=engine.registry)
+    
+    def discover_tenants(self) -> List[str]:
+        """Tenant label values seen on the analysed metrics over the window"""
+        if self.tenants:
+            return self.tenants
+        response = self.engine.session.get(
+            f"{self.engine.prometheus_url}/api/v1/label/{self.tenant_label}/values",
+            params={'match[]': self.engine.metric_names, 'start': time.time() - self.hours * 3600},
+            timeout=self.engine.query_timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Prometheus API error {response.status_code}")
+        return sorted(response.json().get('data', []))
+    
+    def strip_tenant(self, name: str, tenant: str) -> str:
+        """Series name without its tenant label (only a whole tenant_label="<tenant>" matcher)"""
+        metric_name, labels = series_labels(name)
+        value = escape_label_value(tenant)
+        kept = [f'{label}="{escaped}"' for label, escaped in labels
+                if not (label == self.tenant_label and escaped == value)]
+        return f'{metric_name}{{{",".join(kept)}}}' if kept else metric_name
+    
+    def prepare(self, tenant: str) -> Optional[Dict[str, Any]]:
+        """Fetch one tenant's metrics and build its standardized feature matrix"""
+        matcher = f'{self.tenant_label}="{escape_label_value(tenant)}"'
+        selectors = [add_matcher(name, matcher) for name in self.engine.metric_names]
+        metrics_df = self.engine.fetch_metrics(selectors, hours=self.hours)
+        if metrics_df.empty or len(metrics_df) < 10:
+            return None
+        metrics_df = metrics_df.rename(columns=lambda name: self.strip_tenant(name, tenant))
+        metrics_df = metrics_df.loc[:, ~metrics_df.columns.duplicated()]
+        
+        features = self.engine.feature_pipeline(list(metrics_df.columns)).backfill(metrics_df)
+        feature_center, feature_scale = robust_center_scale(features.to_numpy())
+        center, scale = robust_center_scale(metrics_df.to_numpy())
+        return {
+            'tenant': tenant,
+            'metrics': metrics_df,
+            'features': (features - feature_center) / feature_scale,
+            'center': center,
+            'scale': scale
+        }
+    
+    def refresh_model(self, prepared: List[Dict[str, Any]]):
+        """Retrain the shared model on pooled tenant features when needed"""
+        pooled = pd.concat([item['features'] for item in prepared], ignore_index=True).fillna(0.0)
+        if len(pooled) > self.max_train_rows:
+            pooled = pooled.sample(self.max_train_rows, random_state=42)
+        pooled.index = pd.date_range(end=datetime.now(), periods=len(pooled), freq='s')
+        
+        reason = self.engine.retrain_reason(pooled)
+        if reason is not None:
+            self.engine.train_and_promote(pooled, reason)
+    
+    def decide(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Detect, correlate and decide for one prepared tenant"""
+        # Only the decision horizon is scored; the rest of the window is baseline
+        metrics_df = item['metrics']
+        horizon = metrics_df.index > metrics_df.index[-1] - pd.Timedelta(minutes=self.engine.decision_horizon_minutes)
+        recent = self.engine.score_rows(metrics_df[horizon], item['center'], item['scale'], item['features'][horizon])
+        correlations = self.engine.cross_correlation_analysis(metrics_df)
+        expected = self.engine.expected_anomalies(int(horizon.sum()))
+        risk_score = self.engine.calculate_risk_score(recent, correlations, expected_anomalies=expected)
+        decision = self.engine.make_decision(risk_score, recent)
+        self.tenant_risk.labels(**{self.tenant_label: item['tenant']}).set(risk_score)
+        return {
+            'tenant': item['tenant'],
+            'series': int(item['metrics'].shape[1]),
+            'anomalies': len(recent),
+            'risk_score': risk_score,
+            'decision': decision
+        }
+    
+    def run(self) -> Dict[str, Any]:
+        started = time.time()
+        tenants = self.discover_tenants()
+        print(f"🏢 Analysing {len(tenants)} tenants ({self.concurrency} at a time)")
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            prepared = [item for item in pool.map(self.prepare, tenants) if item is not None]
+            if not prepared:
+                print("❌ No tenant metrics available")
+                return {}
+            self.refresh_model(prepared)
+            results = list(pool.map(self.decide, prepared))
+        
+        self.engine.export_metrics_to_prometheus()
+        results.sort(key=lambda result: -result['risk_score'])
+        for result in results[:10]:
+            print(f"   {result['tenant']}: risk {result['risk_score']:.2f} → {result['decision']['action']}")
+        return {
+            'tenants': results,
+            'skipped': sorted(set(tenants) - {result['tenant'] for result in results}),
+            'model_version': self.engine.model_metadata.get('version'),
+            'elapsed_seconds': time.time() - started,
+            'timestamp': datetime.now().isoformat()
+        }
+
+
+class StreamingService:
+    """Long-running online mode: keeps detector state in memory and rescores
+    the risk every poll (instant queries) or remote-write batch, instead of
+    re-reading a 24h range per run.
+    """
+
+    def __init__(self, engine: AIOpsDecisionEngine):
+        self.engine = engine
+        self.detector = OnlineAnomalyDetector(
+            window=int(os.getenv('AIOPS_STREAM_WINDOW', '360')),
+            threshold=float(os.getenv('AIOPS_STREAM_THRESHOLD', '4.0')),
+            warmup=int(os.getenv('AIOPS_STREAM_WARMUP', '30'))
+        )
+        self.poll_seconds = float(os.getenv('AIOPS_STREAM_POLL_SECONDS', '5'))
+        self.push_seconds = float(os.getenv('AIOPS_STREAM_PUSH_SECONDS', '15'))
+        self.max_age_seconds = float(os.getenv('AIOPS_STREAM_MAX_AGE_SECONDS', '300'))
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.last_push = 0.0
+        self.samples_ingested = 0
+        self.risk = 0.0
+        self.risk_updated: Optional[str] = None
+    
+    def ingest(self, names: List[str], values, timestamp: Optional[float] = None):
+        """Feed one sample per named series into the detector"""
+        if names:
+            with self.lock:
+                self.detector.update(names, values, timestamp)
+                self.samples_ingested += len(names)
+    
+    def ingest_remote_write(self, timeseries: List[Tuple[Dict[str, str], List[Tuple[float, float]]]]):
+        """Feed decoded remote-write series in timestamp order.
+
+        Samples are laid out as (series x depth) arrays and fed in rounds:
+        round i is one vectorized detector update over every series with an
+        i-th sample, so a batch costs one update per sample depth (usually
+        one) rather than one per sample.
+        """
+        merged: Dict[str, List[Tuple[float, float]]] = {}
+        for labels, samples in timeseries:
+            merged.setdefault(series_name(labels.get('__name__', ''), labels), []).extend(samples)
+        merged = {name: samples for name, samples in merged.items() if samples}
+        if not merged:
+            return
+        
+        names = np.array(list(merged), dtype=object)
+        depth = max(len(samples) for samples in merged.values())
+        timestamps = np.full((len(names), depth), np.nan)
+        values = np.full((len(names), depth), np.nan)
+        for row, samples in enumerate(merged.values()):
+            ordered = np.asarray(sorted(samples), dtype=float)
+            timestamps[row, :len(ordered)], values[row, :len(ordered)] = ordered[:, 0], ordered[:, 1]
+        
+        with self.lock:
+            for step in range(depth):
+                present = ~np.isnan(timestamps[:, step])
+                self.detector.update(names[present].tolist(), values[present, step], timestamps[present, step])
+            self.samples_ingested += int((~np.isnan(timestamps)).sum())
+    
+    def poll_once(self):
+        """Instant-query every followed metric concurrently and ingest the results"""
+        workers = max(1, min(self.engine.fetch_concurrency, len(self.engine.metric_names)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(self._query_metric, self.engine.metric_names))
+        
+        names, values = [], []
+        for metric_name, result in zip(self.engine.metric_names, results):
+            for item in result[:self.engine.max_series_per_metric]:
+                if item.get('value'):
+                    names.append(series_name(metric_name, item.get('metric', {})))
+                    values.append(float(item['value'][1]))
+        self.ingest(names, values)
+    
+    def _query_metric(self, metric_name: str) -> List[Dict[str, Any]]:
+        try:
+            return self.engine.query_instant(metric_name)
+        except Exception as e:
+            print(f"⚠️  Error polling {metric_name}: {e}")
+            return []
+    
+    def score(self) -> Dict[str, Any]:
+        """Current anomalies, risk score and decision from the in-memory state"""
+        with self.lock:
+            anomalies = self.detector.anomalies(self.max_age_seconds)
+            series_count = len(self.detector.names)
+        risk_score = self.engine.calculate_risk_score(anomalies, {})
+        self.risk = risk_score
+        self.risk_updated = datetime.now().isoformat()
+        self.engine.risk_score.set(risk_score)
+        return {
+            'anomalies': anomalies,
+            'risk_score': risk_score,
+            'series': series_count,
+            'samples_ingested': self.samples_ingested,
+            'timestamp': self.risk_updated
+        }
+    
+    def push_if_due(self):
+        if time.time() - self.last_push >= self.push_seconds:
+            self.last_push = time.time()
+            self.engine.export_metrics_to_prometheus(self.risk)
+    
+    def run(self):
+        """Poll, rescore and push until stopped"""
+        print(f"📡 Streaming {len(self.engine.metric_names)} metrics every {self.poll_seconds}s")
+        while not self.stop_event.is_set():
+            started = time.time()
+            try:
+                self.poll_once()
+                self.score()
+                self.push_if_due()
+            except Exception as e:
+                print(f"⚠️  Streaming cycle error: {e}")
+            self.stop_event.wait(max(0.0, self.poll_seconds - (time.time() - started)))
+    
+    def start(self):
+        if self.poll_seconds > 0 and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='aiops-stream', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.poll_seconds + self.engine.query_timeout)
+
+
+class DecisionService:
+    """Warm decision path for callers that need an answer now (deploy gates,
+    self-heal): the model, a rolling metric window, its robust baseline and
+    the pair correlations are refreshed in the background, so a request only
+    scores the newest rows (or a caller-supplied snapshot) against them.
+    The state (model included) is swapped in whole once refreshed, so a
+    request never waits for a refresh or retrain in progress.
+    """
+
+    def __init__(self, engine: AIOpsDecisionEngine):
+        self.engine = engine
+        self.window_hours = float(os.getenv('AIOPS_DECIDE_WINDOW_HOURS', '6'))
+        self.step_seconds = int(os.getenv('AIOPS_DECIDE_STEP_SECONDS', '60'))
+        self.refresh_seconds = float(os.getenv('AIOPS_DECIDE_REFRESH_SECONDS', '60'))
+        self.score_steps = int(os.getenv('AIOPS_DECIDE_SCORE_STEPS', '5'))
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.state: Optional[Dict[str, Any]] = None
+    
+    def refresh(self, metrics_df: Optional[pd.DataFrame] = None):
+        """Advance the window state by the newly arrived rows; retrains only when the registry says so"""
+        if metrics_df is None:
+            metrics_df = self.engine.fetch_metrics(self.engine.metric_names, hours=self.window_hours,
+                                                   step_seconds=self.step_seconds)
+        if metrics_df.empty or len(metrics_df) < 10:
+            print("⚠️  Decision window not refreshed: not enough data")
+            return
+        
+        correlations = self.engine.cross_correlation_analysis(metrics_df)
+        center, scale = robust_center_scale(metrics_df.to_numpy())
+        previous = (self.state['pipeline'], self.state['features']) if self.state else None
+        pipeline, features = self.engine.window_features(metrics_df, previous)
+        with self.lock:
+            reason = self.engine.retrain_reason(features)
+            if reason is not None:
+                self.engine.train_and_promote(features, reason)
+            self.state = {
+                'window': metrics_df,
+                'features': features,
+                'pipeline': pipeline,
+                'center': center,
+                'scale': scale,
+                'correlations': correlations,
+                'model': self.engine.isolation_forest,
+                'metadata': self.engine.model_metadata,
+                'model_version': self.engine.model_metadata.get('version'),
+                'refreshed_at': datetime.now().isoformat()
+            }
+    
+    def decide(self, snapshot: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """make_decision for the newest window rows, or for `snapshot` laid over the last row.
+        
+        A snapshot is a single row, so its risk is the row's own distance
+        past the model's threshold (row_risk) rather than an anomaly count.
+        """
+        state = self.state
+        if state is None:
+            raise RuntimeError('Decision window is not loaded yet')
+        
+        window = state['window']
+        ignored = []
+        if snapshot:
+            row = window.iloc[[-1]].copy()
+            # The window index is naive UTC (Prometheus timestamps)
+            row.index = pd.DatetimeIndex([pd.Timestamp.now(tz='UTC').tz_localize(None)])
+            known = {name: value for name, value in snapshot.items() if name in row.columns}
+            ignored = sorted(set(snapshot) - set(known))
+            for name, value in known.items():
+                row[name] = float(value)
+            rows = row
+            # Features of the snapshot as the next sample, without advancing the window state
+            feature_row = state['pipeline'].update(row.to_numpy()[0], row.index[0].timestamp(), commit=False)
+            features = pd.DataFrame([feature_row], index=row.index, columns=state['pipeline'].columns)
+        else:
+            rows = window.iloc[-self.score_steps:]
+            features = state['features'].iloc[-self.score_steps:]
+        
+        model, metadata = state['model'], state['metadata']
+        anomalies = self.engine.score_rows(rows, state['center'], state['scale'], features, model, metadata)
+        if snapshot:
+            aligned = self.engine.align_features(features, metadata)
+            risk_score = self.engine.row_risk(model.score_samples(aligned)[0], model) if aligned is not None else 0.0
+        else:
+            expected = self.engine.expected_anomalies(len(rows), model)
+            risk_score = self.engine.calculate_risk_score(anomalies, state['correlations'], expected_anomalies=expected)
+        decision = self.engine.make_decision(risk_score, anomalies)
+        
+        return {
+            **decision,
+            'risk_score': risk_score,
+            'anomalies': anomalies,
+            'ignored_series': ignored,
+            'model_version': state['model_version'],
+            'window_end': window.index[-1].isoformat(),
+            'refreshed_at': state['refreshed_at']
+        }
+    
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️  Decision window refresh error: {e}")
+            self.stop_event.wait(self.refresh_seconds)
+    
+    def start(self):
+        if self.refresh_seconds > 0 and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='aiops-decide', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+
+
+class AlertService:
+    """Event-driven analysis for Alertmanager webhooks.
+
+    Each firing alert is turned into label-scoped selectors for the metrics
+    it names (annotation `aiops_metrics`, else the engine's metric list) and
+    analysed on a narrow window only. Repeats of an alert within the debounce
+    period, or while its analysis is in flight, are skipped; analyses run on
+    a bounded pool with a bounded backlog.
+    """
+
+    # Alert labels that describe the alert rather than the affected series
+    ALERT_ONLY_LABELS = ('alertname', 'severity', 'alertstate', 'team', 'receiver')
+
+    def __init__(self, engine: AIOpsDecisionEngine):
+        self.engine = engine
+        self.window_minutes = float(os.getenv('AIOPS_ALERT_WINDOW_MINUTES', '60'))
+        self.step_seconds = int(os.getenv('AIOPS_ALERT_STEP_SECONDS', '30'))
+        self.score_steps = int(os.getenv('AIOPS_ALERT_SCORE_STEPS', '10'))
+        self.zscore_threshold = float(os.getenv('AIOPS_ALERT_ZSCORE_THRESHOLD', '4.0'))
+        self.debounce_seconds = float(os.getenv('AIOPS_ALERT_DEBOUNCE_SECONDS', '120'))
+        self.max_pending = int(os.getenv('AIOPS_ALERT_MAX_PENDING', '32'))
+        self.pool = ThreadPoolExecutor(max_workers=int(os.getenv('AIOPS_ALERT_CONCURRENCY', '4')),
+                                       thread_name_prefix='aiops-alert')
+        self.lock = threading.Lock()
+        self.last_started: Dict[str, float] = {}
+        self.in_flight: set = set()
+        self.recent: List[Dict[str, Any]] = []
+    
+    def alert_key(self, alert: Dict[str, Any]) -> str:
+        if alert.get('fingerprint'):
+            return alert['fingerprint']
+        return json.dumps(alert.get('labels', {}), sort_keys=True)
+    
+    def selectors(self, alert: Dict[str, Any]) -> List[str]:
+        """Label-scoped PromQL selectors for the metrics an alert affects"""
+        labels = alert.get('labels', {})
+        annotated = alert.get('annotations', {}).get('aiops_metrics', '')
+        metric_names = [name.strip() for name in annotated.split(',') if name.strip()] or self.engine.metric_names
+        matchers = ','.join(f'{key}="{escape_label_value(value)}"' for key, value in sorted(labels.items())
+                            if key not in self.ALERT_ONLY_LABELS and not key.startswith('__'))
+        return [add_matcher(name, matchers) if matchers else name for name in metric_names]
+    
+    def submit(self, payload: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Queue analyses for the firing alerts of a webhook payload"""
+        outcome: Dict[str, List[str]] = {'accepted': [], 'debounced': [], 'rejected': [], 'ignored': []}
+        now = time.time()
+        with self.lock:
+            self.last_started = {key: started for key, started in self.last_started.items()
+                                 if now - started < self.debounce_seconds}
+        for alert in payload.get('alerts', []):
+            key = self.alert_key(alert)
+            if alert.get('status', payload.get('status')) != 'firing':
+                outcome['ignored'].append(key)
+                continue
+            with self.lock:
+                if key in self.in_flight or now - self.last_started.get(key, 0.0) < self.debounce_seconds:
+                    outcome['debounced'].append(key)
+                    continue
+                if len(self.in_flight) >= self.max_pending:
+                    outcome['rejected'].append(key)
+                    continue
+                self.in_flight.add(key)
+                self.last_started[key] = now
+            self.pool.submit(self._run, key, alert)
+            outcome['accepted'].append(key)
+        return outcome
+    
+    def _run(self, key: str, alert: Dict[str, Any]):
+        try:
+            result = self.analyze(alert)
+            with self.lock:
+                self.recent = (self.recent + [result])[-100:]
+        except Exception as e:
+            print(f"⚠️  Alert analysis error ({key}): {e}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(key)
+    
+    def analyze(self, alert: Dict[str, Any]) -> Dict[str, Any]:
+        """Targeted analysis of one alert's series on the narrow window"""
+        started = time.time()
+        alertname = alert.get('labels', {}).get('alertname', 'unknown')
+        selectors = self.selectors(alert)
+        missing: List[str] = []
+        metrics_df = self.engine.fetch_metrics(selectors, hours=self.window_minutes / 60.0,
+                                               step_seconds=self.step_seconds, missing=missing)
+        # Selectors without data are reported, not scored as flat zero series
+        metrics_df = metrics_df.drop(columns=[name for name in missing if name in metrics_df.columns])
+        
+        anomalies = []
+        correlations: Dict[str, float] = {}
+        if not metrics_df.empty and len(metrics_df) > self.score_steps:
+            # Score the newest steps against the rest of the window
+            baseline = metrics_df.iloc[:-self.score_steps].to_numpy()
+            center, scale = robust_center_scale(baseline)
+            recent = metrics_df.iloc[-self.score_steps:]
+            zscores = np.abs((recent.to_numpy() - center) / scale)
+            columns = metrics_df.columns
+            for idx in np.flatnonzero(zscores.max(axis=1) >= self.zscore_threshold):
+                flagged = np.flatnonzero(zscores[idx] >= self.zscore_threshold)
+                flagged = flagged[np.argsort(-zscores[idx, flagged])][:self.engine.anomaly_top_series]
+                anomalies.append({
+                    'timestamp': recent.index[idx].isoformat(),
+                    'metric_values': {columns[j]: float(recent.iat[idx, j]) for j in flagged},
+                    'series_zscores': {columns[j]: float(zscores[idx, j]) for j in flagged},
+                    'severity': 'high' if zscores[idx].max() >= 2 * self.zscore_threshold else 'medium'
+                })
+            correlations = self.engine.cross_correlation_analysis(metrics_df)
+        
+        risk_score = self.engine.calculate_risk_score(anomalies, correlations)
+        decision = self.engine.make_decision(risk_score, anomalies)
+        if metrics_df.shape[1] == 0:
+            decision = {'action': 'none', 'confidence': 0.0, 'reason': "No data for the alert's series"}
+        self.engine.alert_risk_score.labels(alertname=alertname).set(risk_score)
+        self.engine.export_metrics_to_prometheus()
+        
+        result = {
+            'alertname': alertname,
+            'fingerprint': self.alert_key(alert),
+            'selectors': selectors,
+            'series': int(metrics_df.shape[1]),
+            'missing_selectors': missing,
+            'status': 'missing_data' if metrics_df.shape[1] == 0 else 'analyzed',
+            'anomalies': anomalies,
+            'risk_score': risk_score,
+            'decision': decision,
+            'latency_seconds': time.time() - started,
+            'timestamp': datetime.now().isoformat()
+        }
+        print(f"🚨 {alertname}: {decision['action']} (risk {risk_score:.2f}, "
+              f"{result['series']} series, {result['latency_seconds']:.2f}s)")
+        if missing:
+            print(f"⚠️  {alertname}: no data for {len(missing)} of {len(selectors)} selectors")
+        return result
+    
+    def stop(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+STREAM: Optional[StreamingService] = None
+DECIDER: Optional[DecisionService] = None
+ALERTS: Optional[AlertService] = None
+
+if FastAPI is not None:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """Start the polling loop and the decision window for the lifetime of the service"""
+        global STREAM, DECIDER, ALERTS
+        engine = AIOpsDecisionEngine()
+        engine.load_model()
+        STREAM = StreamingService(engine)
+        DECIDER = DecisionService(engine)
+        ALERTS = AlertService(engine)
+        STREAM.start()
+        DECIDER.start()
+        yield
+        ALERTS.stop()
+        DECIDER.stop()
+        STREAM.stop()
+
+    app = FastAPI(title="AIOps Decision Engine", version="6.8.0", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health():
+        """Health check endpoint"""
+        return {
+            'status': 'healthy',
+            'series': len(STREAM.detector.names) if STREAM else 0,
+            'risk_updated': STREAM.risk_updated if STREAM else None,
+            'decision_window': DECIDER.state['refreshed_at'] if DECIDER and DECIDER.state else None
+        }
+
+    class DecideRequest(BaseModel):
+        metrics: Optional[Dict[str, float]] = None
+
+    @app.post("/decide")
+    def decide(request: Optional[DecideRequest] = None):
+        """Rollback/alert decision from the warm model and rolling window"""
+        try:
+            return DECIDER.decide(request.metrics if request else None)
+        except RuntimeError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    def ingest_remote_write_payload(body: bytes):
+        """Decode, ingest and rescore one remote-write batch (CPU-bound; runs in the threadpool)"""
+        try:
+            timeseries = decode_remote_write(snappy.uncompress(body))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f'Invalid remote-write payload: {e}')
+        
+        STREAM.ingest_remote_write(timeseries)
+        STREAM.score()
+        STREAM.push_if_due()
+
+    @app.post("/api/v1/write", status_code=204)
+    async def remote_write(request: Request):
+        """Prometheus remote-write receiver (snappy-compressed protobuf)"""
+        if snappy is None:
+            raise HTTPException(status_code=415, detail='python-snappy is not installed')
+        await run_in_threadpool(ingest_remote_write_payload, await request.body())
+        return Response(status_code=204)
+
+    @app.post("/alerts", status_code=202)
+    async def alerts(request: Request):
+        """Alertmanager webhook receiver: analyses firing alerts in the background"""
+        try:
+            payload = await request.json()
+        except Exception:
+            raise HTTPException(status_code=400, detail='Invalid Alertmanager payload')
+        if (not isinstance(payload, dict) or not isinstance(payload.get('alerts'), list)
+                or not all(isinstance(alert, dict) for alert in payload['alerts'])):
+            raise HTTPException(status_code=400, detail='Alertmanager payload must be an object with an alerts list')
+        return ALERTS.submit(payload)
+
+    @app.get("/alerts/decisions")
+    async def alert_decisions():
+        """Most recent alert-triggered analyses, newest last"""
+        return ALERTS.recent
+
+    @app.get("/risk")
+    def risk():
+        """Risk score and anomalies from the streaming detector state"""
+        return STREAM.score()
+
+
 def main():
     """Main entry point"""
     engine = AIOpsDecisionEngine()
+    
+    # Model registry maintenance: `rollback` or `promote <version>`
+    if len(sys.argv) > 1 and sys.argv[1] == 'rollback':
+        version = engine.model_registry.rollback()
+        print(f"↩️  Rolled back to model v{version}" if version else "⚠️  No previous model version")
+        sys.exit(0 if version else 1)
+    
+    if len(sys.argv) > 2 and sys.argv[1] == 'promote':
+        engine.model_registry.promote(int(sys.argv[2]))
+        print(f"✅ Promoted model v{sys.argv[2]}")
+        sys.exit(0)
+    
+    # Multi-tenant mode: one risk score and decision per organization
+    if len(sys.argv) > 1 and sys.argv[1] == 'tenants':
+        results = TenantAnalyzer(engine).run()
+        sys.exit(0 if results else 1)
+    
+    # Offline evaluation: `replay <history> [incidents]`
+    if len(sys.argv) > 2 and sys.argv[1] == 'replay':
+        report = ReplayHarness(engine).run(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+    
+    # Online mode: `serve` runs the streaming detector behind a small HTTP API
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        if FastAPI is None:
+            print("❌ Streaming mode requires fastapi and uvicorn")
+            sys.exit(1)
+        import uvicorn
+        uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('AIOPS_PORT', '8080')))
+        sys.exit(0)
+    
     results = engine.run_analysis()
     
     if results:
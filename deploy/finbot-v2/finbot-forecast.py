@@ -8,35 +8,982 @@ import os
 import sys
 import json
 import time
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+import sqlite3
+import gzip
+import hashlib
+import fcntl
+import mmap
+import struct
+import threading
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import asynccontextmanager, closing, contextmanager
+from datetime import datetime, timedelta, timezone
+from statistics import NormalDist
+from typing import Dict, List, Any, Optional, Tuple
 import numpy as np
 import pandas as pd
 from prometheus_client import CollectorRegistry, Gauge, Counter, push_to_gateway
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
 
+# Prophet (and cmdstanpy through it) costs seconds to import, so it is only
+# imported by load_prophet() when a Prophet forecast is actually requested
+Prophet = None
+PROPHET_AVAILABLE = importlib.util.find_spec('prophet') is not None
+PROPHET_IMPORT_SECONDS: Optional[float] = None
+if not PROPHET_AVAILABLE:
+    print("⚠️  Prophet not installed, using placeholder")
+
+PROCESS_START = time.monotonic()
+FIRST_FORECAST_SECONDS: Optional[float] = None
+
+# Pre-forked Prophet workers (see start_warm_pool), None unless enabled
+WARM_POOL: Optional[ProcessPoolExecutor] = None
+
+# Leader-computes/everyone-reads forecast sharing across uvicorn workers
+SHARED_RESULTS_PATH = os.getenv('FINBOT_SHARED_RESULTS_PATH', '')
+SHARED_MAX_AGE_SECONDS = float(os.getenv('FINBOT_SHARED_MAX_AGE_SECONDS', '900'))
+
+# Optional response encoders; formats whose library is missing are not offered
 try:
-    from prophet import Prophet
+    import msgpack
 except ImportError:
-    print("⚠️  Prophet not installed, using placeholder")
-    Prophet = None
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+def load_prophet():
+    """Import Prophet on first use; returns the Prophet class or None"""
+    global Prophet, PROPHET_AVAILABLE, PROPHET_IMPORT_SECONDS
+    if Prophet is None and PROPHET_AVAILABLE:
+        start = time.perf_counter()
+        try:
+            from prophet import Prophet as prophet_class
+            Prophet = prophet_class
+        except ImportError as e:
+            print(f"⚠️  Prophet import failed, using placeholder: {e}")
+            PROPHET_AVAILABLE = False
+        PROPHET_IMPORT_SECONDS = time.perf_counter() - start
+    return Prophet
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Optionally pre-warm Prophet workers before serving requests"""
+    start_warm_pool(int(os.getenv('FINBOT_WARM_POOL_SIZE', '0')))
+    yield
+    if WARM_POOL is not None:
+        WARM_POOL.shutdown(wait=False, cancel_futures=True)
 
 
 app = FastAPI(
     title="Dese FinBot Service",
     description="Cost & ROI forecasting endpoints",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
+FORECAST_ENGINES = ('prophet', 'ets', 'auto')
+
+# Forecast modes, cheapest first: point (no intervals), interval (analytic or
+# reduced-sample intervals), full (Prophet's full uncertainty sampling)
+FORECAST_MODES = ('point', 'interval', 'full')
+
+# Prior latency estimates (ms) per engine/mode until real timings are observed
+DEFAULT_MODE_LATENCY_MS = {
+    ('prophet', 'point'): 150.0,
+    ('prophet', 'interval'): 400.0,
+    ('prophet', 'full'): 2500.0,
+    ('ets', 'point'): 1.0,
+    ('ets', 'interval'): 2.0,
+    ('ets', 'full'): 2.0,
+}
+
+
+# Prophet settings unless the self-optimization loop's hyperparameter search
+# has written tuned ones (FINBOT_TUNED_CONFIG)
+DEFAULT_PROPHET_PARAMS = {
+    'seasonality_mode': 'multiplicative',
+    'changepoint_prior_scale': 0.05,
+    'seasonality_prior_scale': 10.0,
+}
+TUNED_CONFIG_PATH = os.getenv('FINBOT_TUNED_CONFIG', '/var/lib/self-opt-shared/tuned-config.json')
+
+
+def prophet_params() -> Dict[str, Any]:
+    """Prophet settings: tuned ones if a tuned config exists, else defaults"""
+    params = dict(DEFAULT_PROPHET_PARAMS)
+    try:
+        with open(TUNED_CONFIG_PATH) as f:
+            tuned = json.load(f).get('prophet_model', {}).get('params', {})
+        params.update({key: tuned[key] for key in params if key in tuned})
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Tuned config error, using default Prophet settings: {e}")
+    return params
+
+
+class ProphetEngine:
+    """Prophet-backed forecasting engine (full model, slow to fit).
+
+    With a warm worker pool the fit is deferred and fit + predict run together
+    in a pre-warmed worker, so this process never imports Prophet; `model`
+    then stays None.
+    """
+
+    name = 'prophet'
+
+    def __init__(self, pool: Optional[ProcessPoolExecutor] = None, params: Optional[Dict[str, Any]] = None):
+        self.model = None
+        self.pool = pool
+        self.params = params
+        self.train: Optional[pd.DataFrame] = None
+
+    def fit(self, df: pd.DataFrame) -> 'ProphetEngine':
+        """Fit Prophet on a ds/y history frame"""
+        if self.pool is not None:
+            self.train = df[['ds', 'y']].copy()
+            return self
+
+        prophet_class = load_prophet()
+        if prophet_class is None:
+            raise RuntimeError('Prophet is not installed')
+
+        model = prophet_class(
+            yearly_seasonality=False,
+            weekly_seasonality=True,
+            daily_seasonality=False,
+            **(self.params or prophet_params())
+        )
+        model.add_seasonality(name='monthly', period=30.5, fourier_order=5)
+        model.fit(df)
+
+        self.model = model
+        return self
+
+    def predict(self, periods: int, mode: str = 'full', interval_samples: int = 200) -> pd.DataFrame:
+        """Forecast the next `periods` days (future rows only)"""
+        if self.pool is not None:
+            return self.pool.submit(prophet_fit_predict, self.train, periods, mode, interval_samples).result()
+
+        future = self.model.make_future_dataframe(periods=periods, include_history=False)
+        
+        default_samples = self.model.uncertainty_samples
+        self.model.uncertainty_samples = {
+            'point': 0,
+            'interval': min(interval_samples, default_samples),
+            'full': default_samples,
+        }[mode]
+        try:
+            forecast = self.model.predict(future)
+        finally:
+            self.model.uncertainty_samples = default_samples
+        
+        if mode == 'point':
+            forecast['yhat_lower'] = forecast['yhat']
+            forecast['yhat_upper'] = forecast['yhat']
+        return forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].reset_index(drop=True)
+
+
+class ETSEngine:
+    """Vectorized additive Holt-Winters (ETS(A,A,A)) engine in pure NumPy.
+
+    Fits many series at once: every row of a 2-D (series x time) array is
+    filtered against a small grid of smoothing parameters in a single pass,
+    and the best parameter set is picked per series by one-step-ahead SSE.
+    Prediction intervals use the analytic ETS(A,A,A) forecast variance.
+    """
+
+    name = 'ets'
+
+    ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+    BETA_RATIOS = (0.0, 0.05, 0.15)
+    GAMMAS = (0.0, 0.05, 0.1, 0.2, 0.3)
+
+    def __init__(self, season_length: int = 7, interval_width: float = 0.8):
+        self.season_length = season_length
+        self.interval_width = interval_width
+        self.z_score = NormalDist().inv_cdf(0.5 + interval_width / 2)
+        self.state: Dict[str, np.ndarray] = {}
+        self.last_ds: Optional[pd.Timestamp] = None
+
+    def _parameter_grid(self, season_length: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Admissible (alpha, beta, gamma) combinations as flat arrays"""
+        gammas = self.GAMMAS if season_length > 1 else (0.0,)
+        grid = [
+            (alpha, alpha * ratio, gamma)
+            for alpha in self.ALPHAS
+            for ratio in self.BETA_RATIOS
+            for gamma in gammas
+            if gamma <= 1.0 - alpha
+        ]
+        alpha, beta, gamma = (np.array(column) for column in zip(*grid))
+        return alpha, beta, gamma
+
+    def fit_arrays(self, values: np.ndarray) -> 'ETSEngine':
+        """Fit every row of a (series x time) array in one vectorized pass"""
+        y = np.atleast_2d(np.asarray(values, dtype=float))
+        n_series, n_obs = y.shape
+        if n_obs < 4:
+            raise ValueError('ETS engine needs at least 4 observations')
+
+        m = self.season_length if n_obs >= 2 * self.season_length else 1
+        alpha, beta, gamma = self._parameter_grid(m)
+        n_params = alpha.size
+
+        # Classical initialisation from the first two seasons
+        if m > 1:
+            level0 = y[:, :m].mean(axis=1)
+            trend0 = (y[:, m:2 * m].mean(axis=1) - level0) / m
+            season0 = y[:, :m] - level0[:, None]
+        else:
+            level0 = y[:, 0]
+            trend0 = y[:, 1] - y[:, 0]
+            season0 = np.zeros((n_series, 1))
+
+        # State arrays are (params x series [x season]) so one loop over time
+        # updates every parameter combination of every series simultaneously
+        level = np.repeat(level0[None, :], n_params, axis=0)
+        trend = np.repeat(trend0[None, :], n_params, axis=0)
+        season = np.repeat(season0[None, :, :], n_params, axis=0)
+        sse = np.zeros((n_params, n_series))
+        a, b, g = alpha[:, None], beta[:, None], gamma[:, None]
+
+        for t in range(n_obs):
+            idx = t % m
+            error = y[:, t] - (level + trend + season[:, :, idx])
+            sse += error * error
+            level = level + trend + a * error
+            trend = trend + b * error
+            season[:, :, idx] += g * error
+
+        best = np.argmin(sse, axis=0)
+        cols = np.arange(n_series)
+        self.state = {
+            'level': level[best, cols],
+            'trend': trend[best, cols],
+            'season': season[best, cols],
+            'alpha': alpha[best],
+            'beta': beta[best],
+            'gamma': gamma[best],
+            'sigma2': sse[best, cols] / max(n_obs - 3, 1),
+        }
+        self.fitted_season_length = m
+        self.fitted_n_obs = n_obs
+        return self
+
+    def forecast_arrays(self, periods: int, mode: str = 'interval') -> Dict[str, np.ndarray]:
+        """Point forecasts and analytic intervals as (series x periods) arrays"""
+        if not self.state:
+            raise RuntimeError('ETS engine is not fitted')
+
+        st = self.state
+        m = self.fitted_season_length
+        horizon = np.arange(1, periods + 1)
+        season_idx = (self.fitted_n_obs + horizon - 1) % m
+
+        yhat = (st['level'][:, None] + horizon[None, :] * st['trend'][:, None]
+                + st['season'][:, season_idx])
+        if mode == 'point':
+            return {'yhat': yhat, 'yhat_lower': yhat, 'yhat_upper': yhat}
+
+        # Var(h) = sigma^2 * (1 + sum_{j<h} c_j^2), c_j = alpha + beta*j + gamma*[j % m == 0]
+        j = horizon[:-1]
+        c = (st['alpha'][:, None] + st['beta'][:, None] * j[None, :]
+             + st['gamma'][:, None] * (j % m == 0)[None, :])
+        cumulative = np.concatenate([np.zeros((c.shape[0], 1)), np.cumsum(c * c, axis=1)], axis=1)
+        half_width = self.z_score * np.sqrt(st['sigma2'][:, None] * (1.0 + cumulative))
+
+        return {
+            'yhat': yhat,
+            'yhat_lower': yhat - half_width,
+            'yhat_upper': yhat + half_width,
+        }
+
+    def fit(self, df: pd.DataFrame) -> 'ETSEngine':
+        """Fit on a single ds/y history frame"""
+        self.last_ds = pd.Timestamp(df['ds'].iloc[-1])
+        return self.fit_arrays(df['y'].to_numpy(dtype=float))
+
+    def predict(self, periods: int, mode: str = 'interval') -> pd.DataFrame:
+        """Forecast the next `periods` days for the single fitted series"""
+        arrays = self.forecast_arrays(periods, mode)
+        return pd.DataFrame({
+            'ds': pd.date_range(self.last_ds + pd.Timedelta(days=1), periods=periods, freq='D'),
+            'yhat': arrays['yhat'][0],
+            'yhat_lower': arrays['yhat_lower'][0],
+            'yhat_upper': arrays['yhat_upper'][0],
+        })
+
+
+def create_engine(name: str, pool: Optional[ProcessPoolExecutor] = None,
+                  params: Optional[Dict[str, Any]] = None):
+    """Instantiate a concrete forecasting engine by name"""
+    return ProphetEngine(pool=pool, params=params) if name == 'prophet' else ETSEngine()
+
+
+def engine_params(name: str) -> Dict[str, Any]:
+    """Settings that determine an engine's fits (Prophet's tuned settings, ETS's grid)"""
+    if name == 'prophet':
+        return prophet_params()
+    engine = ETSEngine()
+    return {'season_length': engine.season_length, 'interval_width': engine.interval_width,
+            'alphas': ETSEngine.ALPHAS, 'beta_ratios': ETSEngine.BETA_RATIOS, 'gammas': ETSEngine.GAMMAS}
+
+
+def prophet_fit_predict(train: pd.DataFrame, periods: int, mode: str, interval_samples: int) -> pd.DataFrame:
+    """Fit and predict Prophet in one call (runs inside a warm pool worker)"""
+    return ProphetEngine().fit(train).predict(periods, mode=mode, interval_samples=interval_samples)
+
+
+def warm_prophet_worker():
+    """Pool initializer: import Prophet and load the compiled Stan model once"""
+    global WARM_POOL
+    WARM_POOL = None  # forked from the parent; never submit to its pool from here
+    if load_prophet() is None:
+        return
+    warmup = pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=30, freq='D'),
+                           'y': np.linspace(100.0, 130.0, 30)})
+    ProphetEngine().fit(warmup)
+
+
+def worker_import_seconds() -> Optional[float]:
+    """Prophet import time measured in this process (queried from pool workers)"""
+    return PROPHET_IMPORT_SECONDS
+
+
+def start_warm_pool(size: int) -> Optional[ProcessPoolExecutor]:
+    """Pre-fork `size` Prophet workers and block until they are warm.
+
+    The workers import Prophet, so their (slowest) import time becomes
+    this process's PROPHET_IMPORT_SECONDS.
+    """
+    global WARM_POOL, PROPHET_IMPORT_SECONDS
+    if size <= 0 or not PROPHET_AVAILABLE:
+        return None
+
+    start = time.perf_counter()
+    WARM_POOL = ProcessPoolExecutor(max_workers=size, initializer=warm_prophet_worker)
+    # Workers are spawned on demand; concurrent queries force all of them up now
+    futures = [WARM_POOL.submit(worker_import_seconds) for _ in range(size)]
+    wait(futures)
+    import_seconds = [future.result() for future in futures if future.result() is not None]
+    if import_seconds:
+        PROPHET_IMPORT_SECONDS = max(import_seconds)
+    print(f"✅ Warm Prophet pool ready ({size} workers, {time.perf_counter() - start:.1f}s)")
+    return WARM_POOL
+
+
+def run_backtest_fold(engine_name: str, params: Dict[str, Any], train: pd.DataFrame, actual: np.ndarray,
+                      horizon: int) -> Dict[str, np.ndarray]:
+    """Fit one rolling-origin fold and return its out-of-sample forecast (process pool worker)"""
+    forecast = create_engine(engine_name, params=params).fit(train).predict(horizon, mode='interval')
+    return {
+        'day': forecast['ds'].to_numpy(dtype='datetime64[D]').astype(np.int64),
+        'yhat': forecast['yhat'].to_numpy(dtype=float),
+        'yhat_lower': forecast['yhat_lower'].to_numpy(dtype=float),
+        'yhat_upper': forecast['yhat_upper'].to_numpy(dtype=float),
+        'actual': np.asarray(actual, dtype=float),
+    }
+
+
+class Backtester:
+    """Rolling-origin cross-validation with fingerprint-keyed fold cache.
+
+    Cutoffs fall on calendar days divisible by `period` and every fold trains
+    on a fixed `window` of days before its cutoff, so a fold's inputs (and its
+    cache key) do not change as new history is appended; reruns only fit the
+    folds that are new. The key also covers the engine's settings, so tuned
+    Prophet settings invalidate its folds. Uncached Prophet folds run across a process pool; ETS
+    folds fit in milliseconds and run in-process.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def cutoffs(ds: np.ndarray, window: int, horizon: int, period: int) -> List[int]:
+        """Indexes of cutoff days with a full training window and a full horizon"""
+        days = np.asarray(ds, dtype='datetime64[D]').astype(np.int64)
+        positions = np.arange(window, days.size - horizon + 1)
+        return positions[days[positions] % period == 0].tolist()
+
+    @staticmethod
+    def fingerprint(engine_name: str, params: Dict[str, Any], horizon: int, ds: np.ndarray, y: np.ndarray) -> str:
+        """Stable key for a fold from its engine and settings, horizon and exact input data"""
+        digest = hashlib.sha256(f'{engine_name}:{json.dumps(params, sort_keys=True)}:{horizon}'.encode())
+        digest.update(np.asarray(ds, dtype='datetime64[D]').astype(np.int64).tobytes())
+        digest.update(np.ascontiguousarray(y, dtype=float).tobytes())
+        return digest.hexdigest()[:32]
+
+    def _load_cached(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        if not self.cache_dir:
+            return None
+        path = os.path.join(self.cache_dir, f'{key}.npz')
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as cached:
+            return {name: cached[name] for name in cached.files}
+
+    def _store_cached(self, key: str, fold: Dict[str, np.ndarray]):
+        if self.cache_dir:
+            tmp_path = os.path.join(self.cache_dir, f'{key}.tmp.npz')
+            np.savez(tmp_path, **fold)
+            os.replace(tmp_path, os.path.join(self.cache_dir, f'{key}.npz'))
+
+    def run(self, df: pd.DataFrame, engine_name: str, horizon: int = 14, period: int = 7,
+            window: int = 42, cached_only: bool = False) -> Dict[str, Any]:
+        """Backtest one engine; returns per-horizon MAPE/RMSE/coverage and fold forecasts.
+
+        With cached_only=True no fold is fitted; only cached folds are reported.
+        """
+        ds = df['ds'].to_numpy(dtype='datetime64[D]')
+        y = df['y'].to_numpy(dtype=float)
+        params = engine_params(engine_name)
+
+        folds: Dict[int, Dict[str, np.ndarray]] = {}
+        pending: Dict[int, str] = {}
+        for cutoff in self.cutoffs(ds, window, horizon, period):
+            key = self.fingerprint(engine_name, params, horizon, ds[cutoff - window:cutoff + horizon],
+                                   y[cutoff - window:cutoff + horizon])
+            cached = self._load_cached(key)
+            if cached is not None:
+                folds[cutoff] = cached
+            elif not cached_only:
+                pending[cutoff] = key
+
+        def fold_args(cutoff: int):
+            train = df.iloc[cutoff - window:cutoff][['ds', 'y']].reset_index(drop=True)
+            return engine_name, params, train, y[cutoff:cutoff + horizon], horizon
+
+        if engine_name == 'prophet' and pending and WARM_POOL is not None:
+            futures = {cutoff: WARM_POOL.submit(run_backtest_fold, *fold_args(cutoff)) for cutoff in pending}
+            computed = {cutoff: future.result() for cutoff, future in futures.items()}
+        elif engine_name == 'prophet' and len(pending) > 1 and self.max_workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending))) as pool:
+                futures = {cutoff: pool.submit(run_backtest_fold, *fold_args(cutoff)) for cutoff in pending}
+                computed = {cutoff: future.result() for cutoff, future in futures.items()}
+        else:
+            computed = {cutoff: run_backtest_fold(*fold_args(cutoff)) for cutoff in pending}
+
+        for cutoff, fold in computed.items():
+            self._store_cached(pending[cutoff], fold)
+            folds[cutoff] = fold
+
+        if not folds:
+            return {'engine': engine_name, 'folds': 0}
+
+        ordered = [folds[cutoff] for cutoff in sorted(folds)]
+        actual = np.stack([fold['actual'] for fold in ordered])
+        yhat = np.stack([fold['yhat'] for fold in ordered])
+        lower = np.stack([fold['yhat_lower'] for fold in ordered])
+        upper = np.stack([fold['yhat_upper'] for fold in ordered])
+
+        # (folds x horizon) errors reduced over folds -> per-horizon metrics
+        error = actual - yhat
+        scale = np.where(actual == 0, 1.0, np.abs(actual))
+        return {
+            'engine': engine_name,
+            'folds': len(ordered),
+            'cached_folds': len(ordered) - len(computed),
+            'mape': np.mean(np.abs(error) / scale, axis=0) * 100,
+            'rmse': np.sqrt(np.mean(error ** 2, axis=0)),
+            'coverage': np.mean((actual >= lower) & (actual <= upper), axis=0),
+            'predictions': pd.DataFrame({
+                'ds': pd.to_datetime(np.concatenate([fold['day'] for fold in ordered]), unit='D'),
+                'yhat': yhat.ravel(),
+            }),
+        }
+
+
+# Forecast response formats (format query value -> media type)
+RESPONSE_FORMATS = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.finbot.columnar+json',
+    'msgpack': 'application/x-msgpack',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+PREDICTION_COLUMNS = ('ds', 'yhat', 'yhat_lower', 'yhat_upper')
+COMPRESSION_MIN_BYTES = 1024
+
+
+def available_media_types() -> List[str]:
+    """Media types whose encoder is importable in this process"""
+    missing = {
+        RESPONSE_FORMATS['msgpack']: msgpack is None,
+        RESPONSE_FORMATS['arrow']: pa is None,
+    }
+    return [media_type for media_type in RESPONSE_FORMATS.values() if not missing.get(media_type)]
+
+
+def parse_quality_list(header: str) -> List[Tuple[str, float]]:
+    """(value, q) pairs of an Accept-style header, in header order (q defaults to 1)"""
+    items = []
+    for part in header.split(','):
+        fields = [field.strip() for field in part.split(';')]
+        quality = 1.0
+        for param in fields[1:]:
+            if param.replace(' ', '').lower().startswith('q='):
+                try:
+                    quality = float(param.split('=', 1)[1])
+                except ValueError:
+                    quality = 0.0
+        if fields[0]:
+            items.append((fields[0].lower(), quality))
+    return items
+
+
+def negotiate_media_type(accept: Optional[str], response_format: Optional[str] = None) -> Optional[str]:
+    """Pick a response media type from an explicit format or the Accept header"""
+    supported = available_media_types()
+    if response_format:
+        media_type = RESPONSE_FORMATS.get(response_format)
+        return media_type if media_type in supported else None
+
+    if not accept:
+        return RESPONSE_FORMATS['json']
+
+    candidates = [(-quality, position, media_type)
+                  for position, (media_type, quality) in enumerate(parse_quality_list(accept))]
+
+    for negative_quality, _, media_type in sorted(candidates):
+        if negative_quality == 0:
+            break
+        if media_type in ('*/*', 'application/*'):
+            return RESPONSE_FORMATS['json']
+        if media_type in supported:
+            return media_type
+    return None
+
+
+def prediction_arrays(predictions) -> Dict[str, np.ndarray]:
+    """Forecast as column arrays (ds as datetime64[s]) from a frame or an array mapping"""
+    if isinstance(predictions, pd.DataFrame):
+        return {
+            name: (predictions[name].to_numpy(dtype='datetime64[s]') if name == 'ds'
+                   else predictions[name].to_numpy())
+            for name in predictions.columns
+        }
+    return dict(predictions)
+
+
+def prediction_columns(predictions) -> Dict[str, np.ndarray]:
+    """Forecast as contiguous column arrays (ds as ISO-8601 strings)"""
+    columns = prediction_arrays(predictions)
+    columns['ds'] = np.datetime_as_string(columns['ds'].astype('datetime64[s]'), unit='s')
+    return columns
+
+
+def serialize_forecast(results: Dict[str, Any], media_type: str) -> bytes:
+    """Encode a run_forecast result in the negotiated media type.
+
+    `predictions` may be a DataFrame or a mapping of column arrays (e.g.
+    read-only views over the shared forecast segment).
+    """
+    predictions = results['predictions']
+    meta = {key: value for key, value in results.items() if key != 'predictions'}
+
+    if media_type == RESPONSE_FORMATS['arrow']:
+        arrays = prediction_arrays(predictions)
+        arrays['ds'] = arrays['ds'].astype('datetime64[ms]')
+        table = pa.table(arrays)
+        table = table.replace_schema_metadata({key: json.dumps(value) for key, value in meta.items()})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    columns = {name: values.tolist() for name, values in prediction_columns(predictions).items()}
+
+    if media_type == RESPONSE_FORMATS['columnar']:
+        return json.dumps({**meta, 'predictions': columns}, separators=(',', ':')).encode()
+
+    if media_type == RESPONSE_FORMATS['msgpack']:
+        return msgpack.packb({**meta, 'predictions': columns})
+
+    # Legacy row-oriented JSON
+    names = list(columns)
+    records = [dict(zip(names, row)) for row in zip(*columns.values())]
+    return json.dumps({**meta, 'predictions': records}).encode()
+
+
+def compress_body(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Compress with the accepted encoding of highest q when the body is large enough.
+
+    Encodings with q=0 are refused (RFC 9110); `*` covers unlisted ones. Ties
+    prefer zstd over gzip, and an explicitly listed identity wins when it is
+    ranked above both.
+    """
+    if not accept_encoding or len(body) < COMPRESSION_MIN_BYTES:
+        return body, None
+
+    qualities: Dict[str, float] = {}
+    for coding, quality in parse_quality_list(accept_encoding):
+        qualities.setdefault(coding, quality)
+    wildcard = qualities.get('*', 0.0)
+    available = ['zstd'] if zstandard is not None else []
+    candidates = [(qualities.get(coding, wildcard), coding) for coding in available + ['gzip']]
+    quality, coding = max(candidates, key=lambda candidate: candidate[0])
+    if quality <= 0 or qualities.get('identity', 0.0) > quality:
+        return body, None
+    if coding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(body), 'zstd'
+    return gzip.compress(body, compresslevel=5), 'gzip'
+
+
+class BudgetScenarioEngine:
+    """Monte Carlo cost trajectories and budget variance from forecast uncertainty.
+
+    Trajectories are a (samples x horizon) array. Budgets, what-if cost
+    multipliers and quantiles are evaluated together by broadcasting, so a
+    whole scenario grid costs one vectorized pass over the samples.
+    """
+
+    def __init__(self, n_samples: int = 5000, interval_width: float = 0.8, seed: Optional[int] = None):
+        self.n_samples = n_samples
+        self.z_score = NormalDist().inv_cdf(0.5 + interval_width / 2)
+        self.rng = np.random.default_rng(seed)
+
+    def sample_from_intervals(self, predictions: pd.DataFrame) -> np.ndarray:
+        """Draw trajectories whose per-day spread matches the forecast interval.
+
+        Errors accumulate as independent increments, so day h has exactly the
+        forecast variance at h and consecutive days stay positively correlated
+        (an overrun on day 10 usually persists to day 11). A point forecast
+        has no band to sample from and is rejected.
+        """
+        yhat = predictions['yhat'].to_numpy(dtype=float)
+        sigma = (predictions['yhat_upper'].to_numpy(dtype=float)
+                 - predictions['yhat_lower'].to_numpy(dtype=float)) / (2 * self.z_score)
+        if not np.any(sigma > 0):
+            raise ValueError('forecast has no interval band (point mode); use mode interval or full')
+        variance = np.maximum.accumulate(np.maximum(sigma, 0.0) ** 2)
+        increments = np.sqrt(np.diff(variance, prepend=0.0))
+
+        shocks = self.rng.standard_normal((self.n_samples, yhat.size)) * increments
+        return yhat + np.cumsum(shocks, axis=1)
+
+    def evaluate(self, trajectories: np.ndarray, budgets: List[float],
+                 multipliers: List[float] = (1.0,), period_days: Optional[int] = None,
+                 quantiles: List[float] = (0.05, 0.5, 0.95)) -> Dict[str, np.ndarray]:
+        """Overrun probability and variance quantiles for every (budget, multiplier) pair.
+
+        Variance is (spend - budget) / budget in percent, where spend is the
+        total cost over the first `period_days` of each trajectory. Result
+        arrays are shaped (budgets x multipliers), quantiles are prepended.
+        """
+        budgets = np.asarray(budgets, dtype=float)
+        multipliers = np.asarray(multipliers, dtype=float)
+        spend = trajectories[:, :period_days].sum(axis=1)
+
+        # (samples x budgets x multipliers)
+        variance = (spend[:, None, None] * multipliers[None, None, :]
+                    - budgets[None, :, None]) / budgets[None, :, None] * 100
+
+        return {
+            'overrun_probability': (variance > 0).mean(axis=0),
+            'expected_variance_pct': variance.mean(axis=0),
+            'variance_quantiles': np.quantile(variance, np.asarray(quantiles), axis=0),
+            'expected_spend': spend.mean() * multipliers,
+        }
+
+
+class SharedForecastStore:
+    """Latest forecast shared by all uvicorn workers through an mmapped file.
+
+    Layout: fixed header (magic, version, rows, meta length, publish time),
+    then ds/yhat/yhat_lower/yhat_upper as contiguous 8-byte columns, then the
+    scalar results as JSON. Publishing writes a new file and swaps it in with
+    os.replace, so readers never see a partial write; readers remap only when
+    the file changes and serve NumPy views straight from the mapping. Writers
+    hold an exclusive flock on the lock file, so versions never collide.
+    """
+
+    HEADER = struct.Struct('<8sQQQd')
+    MAGIC = b'FINBOT01'
+    COLUMNS = (('ds', 'datetime64[s]'), ('yhat', '<f8'), ('yhat_lower', '<f8'), ('yhat_upper', '<f8'))
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        # (file key, snapshot) swapped as one tuple, as handler threads share it
+        self._cached: Tuple[Optional[Tuple[int, int, int]], Optional[Dict[str, Any]]] = (None, None)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def publish(self, results: Dict[str, Any]) -> int:
+        """Write a run_forecast result as the next version; returns the version"""
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._write(results)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self, results: Dict[str, Any]) -> int:
+        """publish() body; the caller holds the lock"""
+        current = self.read()
+        version = (current['version'] if current else 0) + 1
+        arrays = prediction_arrays(results['predictions'])
+        rows = len(arrays['ds'])
+        meta = json.dumps({key: value for key, value in results.items() if key != 'predictions'}).encode()
+
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, version, rows, len(meta), time.time()))
+            for name, dtype in self.COLUMNS:
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+            f.write(meta)
+        os.replace(tmp_path, self.path)
+        return version
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """Current snapshot ({version, published_at, results}) or None"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        file_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached_key, cached_snapshot = self._cached
+        if file_key == cached_key:
+            return cached_snapshot
+
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rows, meta_length, published_at = self.HEADER.unpack_from(mapped, 0)
+        if magic != self.MAGIC:
+            return None
+
+        offset = self.HEADER.size
+        predictions = {}
+        for name, dtype in self.COLUMNS:
+            predictions[name] = np.frombuffer(mapped, dtype=dtype, count=rows, offset=offset)
+            offset += rows * 8
+        results = json.loads(mapped[offset:offset + meta_length])
+        results['predictions'] = predictions
+
+        snapshot = {'version': version, 'published_at': published_at, 'results': results}
+        self._cached = (file_key, snapshot)
+        return snapshot
+
+    def get_or_compute(self, compute, max_age_seconds: float) -> Optional[Dict[str, Any]]:
+        """Serve the shared snapshot; if stale, one elected worker recomputes it.
+
+        Election is a non-blocking flock: the winner recomputes and publishes
+        while other workers keep serving the stale snapshot, or wait for the
+        winner when there is nothing to serve yet.
+        """
+        snapshot = self.read()
+        if snapshot and time.time() - snapshot['published_at'] < max_age_seconds:
+            return snapshot
+
+        with open(self.lock_path, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if snapshot:
+                    return snapshot
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                # Another worker may have published while we waited for the lock
+                snapshot = self.read()
+                if snapshot and time.time() - snapshot['published_at'] < max_age_seconds:
+                    return snapshot
+
+                results = compute()
+                if not results:
+                    return snapshot
+                self._write(results)
+                return self.read()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class CostAnomalyDetector:
+    """Incremental cost anomaly detector on forecast residuals.
+
+    Each observed cost is looked up against the cached forecast band for its
+    day (a dict lookup) and scored against running EWMA residual statistics,
+    so every point costs O(1). Residuals are clipped before updating the
+    statistics so one spike does not inflate the scale that should flag the
+    next one. Hourly points are compared against 1/24 of the daily band.
+    """
+
+    def __init__(self, alpha: float = 0.1, threshold: float = 3.0, warmup: int = 5,
+                 interval_width: float = 0.8):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.z_score = NormalDist().inv_cdf(0.5 + interval_width / 2)
+        self.band_version: Optional[Any] = None
+        self.band: Dict[int, Tuple[float, float, float]] = {}
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    def set_band(self, predictions, version: Optional[Any] = None):
+        """Cache the forecast band keyed by epoch day.
+
+        Days whose band has no width (point forecasts) are skipped: their
+        sigma would be zero and every cost would score as an anomaly.
+        """
+        arrays = prediction_arrays(predictions)
+        arrays = {name: np.asarray(arrays[name]) for name in ('ds', 'yhat', 'yhat_lower', 'yhat_upper')}
+        usable = arrays['yhat_upper'] > arrays['yhat_lower']
+        if not usable.all():
+            print(f"⚠️  Skipping {int((~usable).sum())} forecast days without an interval band")
+        days = arrays['ds'][usable].astype('datetime64[D]').astype(np.int64)
+        self.band = dict(zip(days.tolist(), zip(arrays['yhat'][usable].tolist(),
+                                                arrays['yhat_lower'][usable].tolist(),
+                                                arrays['yhat_upper'][usable].tolist())))
+        self.band_version = version
+
+    def update(self, timestamp: datetime, cost: float, granularity: str = 'day') -> Dict[str, Any]:
+        """Score one cost point, then fold it into the residual statistics"""
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        day = int(np.datetime64(timestamp, 'D').astype(np.int64))
+        event: Dict[str, Any] = {'timestamp': timestamp.isoformat(), 'cost': cost, 'anomaly': False}
+        if day not in self.band:
+            event['status'] = 'no_forecast'
+            return event
+
+        scale_factor = 24.0 if granularity == 'hour' else 1.0
+        yhat, lower, upper = (value / scale_factor for value in self.band[day])
+        residual = cost - yhat
+
+        band_sigma = max((upper - lower) / (2 * self.z_score), 1e-9)
+        scale = np.sqrt(self.var) if self.count >= self.warmup and self.var > 0 else band_sigma
+        score = (residual - self.mean) / scale
+
+        outside_band = cost > upper or cost < lower
+        is_anomaly = outside_band and abs(score) >= self.threshold
+        event.update({
+            'status': 'scored',
+            'expected': yhat,
+            'lower': lower,
+            'upper': upper,
+            'score': float(score),
+            'anomaly': bool(is_anomaly),
+            'direction': 'spike' if residual > 0 else 'drop',
+        })
+
+        # Clipped EWMA mean/variance update
+        clipped = self.mean + float(np.clip(residual - self.mean, -self.threshold * scale, self.threshold * scale))
+        diff = clipped - self.mean
+        increment = self.alpha * diff
+        self.mean += increment
+        self.var = (1 - self.alpha) * (self.var + diff * increment)
+        self.count += 1
+
+        return event
+
+
+class CostHistoryStore:
+    """Append-only daily cost history in SQLite with a high-water mark.
+
+    One row per day keyed by epoch day (UTC), so re-appending a day
+    overwrites it and reads come back as contiguous NumPy arrays ordered by day.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cost_history ('
+                'day INTEGER PRIMARY KEY, cost REAL NOT NULL)'
+            )
+
+    @contextmanager
+    def connect(self):
+        """Connection that commits on success and is always closed"""
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            yield conn
+
+    def _edge_day(self, aggregate: str) -> Optional[datetime]:
+        with self.connect() as conn:
+            (day,) = conn.execute(f'SELECT {aggregate}(day) FROM cost_history').fetchone()
+        if day is None:
+            return None
+        return datetime.fromtimestamp(int(day) * 86400, tz=timezone.utc)
+
+    def high_water_mark(self) -> Optional[datetime]:
+        """Last stored day (UTC midnight), or None when the store is empty"""
+        return self._edge_day('MAX')
+
+    def low_water_mark(self) -> Optional[datetime]:
+        """First stored day (UTC midnight), or None when the store is empty"""
+        return self._edge_day('MIN')
+
+    def append(self, ds: np.ndarray, y: np.ndarray) -> int:
+        """Upsert daily points; returns the number of rows written"""
+        days = np.asarray(ds, dtype='datetime64[D]').astype(np.int64)
+        costs = np.asarray(y, dtype=float)
+        with self.connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO cost_history (day, cost) VALUES (?, ?)',
+                zip(days.tolist(), costs.tolist())
+            )
+        return int(days.size)
+
+    def load(self, days: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (datetime64[D], float64) arrays for the last `days` stored days"""
+        query = 'SELECT day, cost FROM cost_history'
+        params: Tuple = ()
+        if days is not None:
+            query += ' WHERE day > (SELECT MAX(day) FROM cost_history) - ?'
+            params = (days,)
+        with self.connect() as conn:
+            rows = conn.execute(query + ' ORDER BY day', params).fetchall()
+
+        if not rows:
+            return np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=float)
+        data = np.array(rows, dtype=float)
+        return data[:, 0].astype(np.int64).astype('datetime64[D]'), data[:, 1]
+
+    def load_frame(self, days: Optional[int] = None) -> pd.DataFrame:
+        """Stored history as a ds/y frame"""
+        ds, y = self.load(days)
+        return pd.DataFrame({'ds': pd.to_datetime(ds), 'y': y})
+
 
 class FinBotForecaster:
     """Cost & ROI forecasting using Prophet time-series analysis"""
     
+    # Observed prediction latency (ms) per (engine, mode), shared by all
+    # instances in the process so latency budgets improve over time
+    mode_latency_ms: Dict[Tuple[str, str], float] = dict(DEFAULT_MODE_LATENCY_MS)
+    
     def __init__(self):
         self.prometheus_gateway = os.getenv('PROMETHEUS_GATEWAY', 'http://prometheus:9091')
         self.backend_url = os.getenv('BACKEND_URL', 'http://localhost:3001')
         self.prometheus_url = os.getenv('PROMETHEUS_URL', 'http://prometheus:9090')
         self.prediction_horizon = int(os.getenv('FINBOT_PREDICTION_DAYS', '90'))
+        self.training_days = int(os.getenv('FINBOT_TRAINING_DAYS', '90'))
+        
+        # Local cost history (set FINBOT_HISTORY_PATH to '' to always refetch)
+        history_path = os.getenv('FINBOT_HISTORY_PATH', '/tmp/finbot/cost-history.db')
+        self.history_store = CostHistoryStore(history_path) if history_path else None
         
         # Prometheus metrics
         self.registry = CollectorRegistry()
@@ -48,72 +995,144 @@ class FinBotForecaster:
                               registry=self.registry)
         self.budget_variance = Gauge('finbot_budget_variance', 'Budget variance percentage', 
                                     registry=self.registry)
+        self.backtest_mape = Gauge('finbot_backtest_mape', 'Backtest MAPE percentage by horizon day',
+                                   ['engine', 'horizon'], registry=self.registry)
+        self.backtest_rmse = Gauge('finbot_backtest_rmse', 'Backtest RMSE (USD) by horizon day',
+                                   ['engine', 'horizon'], registry=self.registry)
+        self.backtest_coverage = Gauge('finbot_backtest_coverage', 'Backtest interval coverage (0-1) by horizon day',
+                                       ['engine', 'horizon'], registry=self.registry)
+        self.prediction_latency = Gauge('finbot_prediction_latency_seconds',
+                                        'Latency of the last prediction by engine and mode',
+                                        ['engine', 'mode'], registry=self.registry)
+        self.prophet_import_seconds = Gauge('finbot_prophet_import_seconds',
+                                            'Time spent importing Prophet in this process',
+                                            registry=self.registry)
+        self.time_to_first_forecast = Gauge('finbot_time_to_first_forecast_seconds',
+                                            'Time from process start to the first completed forecast',
+                                            registry=self.registry)
+        self.budget_overrun_probability = Gauge('finbot_budget_overrun_probability',
+                                                'Probability of exceeding the budget (0-1)',
+                                                registry=self.registry)
+        
+        # Forecasting engine (prophet|ets|auto); auto uses ETS for short horizons
+        self.forecast_engine = os.getenv('FINBOT_FORECAST_ENGINE', 'auto')
+        self.ets_max_horizon = int(os.getenv('FINBOT_ETS_MAX_HORIZON', '30'))
+        self.engine = None
+        self.forecast_mode = os.getenv('FINBOT_FORECAST_MODE', 'interval')
+        self.interval_samples = int(os.getenv('FINBOT_INTERVAL_SAMPLES', '200'))
+        
+        # Budget scenarios (budget defaults to the trailing period's actual spend)
+        budget = os.getenv('FINBOT_BUDGET_USD')
+        self.budget = float(budget) if budget else None
+        self.budget_period_days = int(os.getenv('FINBOT_BUDGET_PERIOD_DAYS', '30'))
+        self.scenario_samples = int(os.getenv('FINBOT_SCENARIO_SAMPLES', '5000'))
+        
+        # Rolling-origin backtest (fold results cached on disk by data fingerprint).
+        # Fitting folds is slow, so forecasts only read cached folds unless
+        # enabled; /forecast/backtest and `finbot-forecast.py backtest` fit them
+        self.backtest_enabled = os.getenv('FINBOT_BACKTEST_ENABLED', 'false').lower() == 'true'
+        self.backtest_horizon = int(os.getenv('FINBOT_BACKTEST_HORIZON', '14'))
+        self.backtest_period = int(os.getenv('FINBOT_BACKTEST_PERIOD', '7'))
+        self.backtest_window = int(os.getenv('FINBOT_BACKTEST_WINDOW', '42'))
+        self.backtester = Backtester(
+            cache_dir=os.getenv('FINBOT_BACKTEST_CACHE', '/var/lib/finbot/backtest') or None,
+            max_workers=int(os.getenv('FINBOT_BACKTEST_WORKERS', '0')) or None,
+        )
         
         # Prophet model
         self.prophet_model = None
         self.correlation_score = 0.0
     
-    def fetch_historical_cost_data(self, days: int = 90) -> pd.DataFrame:
-        """Fetch historical cost data from backend API or Prometheus"""
+    def fetch_remote_cost_data(self, start_date: datetime, end_date: datetime) -> pd.DataFrame:
+        """Fetch daily cost points in [start_date, end_date] (timezone-aware) from backend API or Prometheus.
+
+        Points come back with naive UTC `ds`, like the history store.
+        """
+        import requests
+        
+        # Try to fetch from backend analytics API
         try:
-            import requests
+            analytics_url = f"{self.backend_url}/api/v1/analytics/dashboard"
+            response = requests.get(analytics_url, timeout=10)
             
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=days)
-            
-            # Try to fetch from backend analytics API
-            try:
-                analytics_url = f"{self.backend_url}/api/v1/analytics/dashboard"
-                response = requests.get(analytics_url, timeout=10)
+            if response.status_code == 200:
+                data = response.json()
+                # Extract cost history if available
+                cost_history = data.get('costHistory', data.get('historicalCosts', []))
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    # Extract cost history if available
-                    cost_history = data.get('costHistory', data.get('historicalCosts', []))
+                if cost_history and len(cost_history) > 0:
+                    # Convert to DataFrame
+                    df = pd.DataFrame(cost_history)
+                    if 'date' in df.columns and 'cost' in df.columns:
+                        df['ds'] = pd.to_datetime(df['date'], utc=True).dt.tz_localize(None)
+                        df['y'] = df['cost'].astype(float)
+                        in_range = (df['ds'] >= pd.Timestamp(start_date).tz_convert(None).normalize()) & \
+                            (df['ds'] <= pd.Timestamp(end_date).tz_convert(None))
+                        return df.loc[in_range, ['ds', 'y']]
+        except Exception as api_error:
+            print(f"⚠️  Backend API error, trying Prometheus: {api_error}")
+        
+        # Try Prometheus for cost metrics
+        try:
+            query = 'finbot_cost_prediction'  # Or relevant cost metric
+            prometheus_url = f"{self.prometheus_url}/api/v1/query_range"
+            params = {
+                'query': query,
+                'start': start_date.timestamp(),
+                'end': end_date.timestamp(),
+                'step': '1d'
+            }
+            
+            response = requests.get(prometheus_url, params=params, timeout=10)
+            
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('status') == 'success' and data.get('data', {}).get('result'):
+                    result = data['data']['result'][0]
+                    values = result.get('values', [])
                     
-                    if cost_history and len(cost_history) > 0:
-                        # Convert to DataFrame
-                        df = pd.DataFrame(cost_history)
-                        if 'date' in df.columns and 'cost' in df.columns:
-                            df['ds'] = pd.to_datetime(df['date'])
-                            df['y'] = df['cost'].astype(float)
-                            return df[['ds', 'y']]
-            except Exception as api_error:
-                print(f"⚠️  Backend API error, trying Prometheus: {api_error}")
-            
-            # Try Prometheus for cost metrics
-            try:
-                query = 'finbot_cost_prediction'  # Or relevant cost metric
-                prometheus_url = f"{self.prometheus_url}/api/v1/query_range"
-                params = {
-                    'query': query,
-                    'start': start_date.timestamp(),
-                    'end': end_date.timestamp(),
-                    'step': '1d'
-                }
+                    if values:
+                        # [[ts, "value"], ...] -> (n, 2) float array in one conversion
+                        raw = np.asarray(values, dtype=float)
+                        return pd.DataFrame({
+                            'ds': pd.to_datetime(raw[:, 0], unit='s'),
+                            'y': raw[:, 1]
+                        })
+        except Exception as prom_error:
+            print(f"⚠️  Prometheus error: {prom_error}")
+        
+        return pd.DataFrame()
+    
+    def fetch_historical_cost_data(self, days: int = 90) -> pd.DataFrame:
+        """Fetch historical cost data, incrementally through the local history store"""
+        try:
+            end_date = datetime.now(timezone.utc)
+            start_date = end_date - timedelta(days=days)
+            
+            if self.history_store is not None:
+                # Only fetch what is newer than the high-water mark (the last
+                # stored day is re-fetched because it may have been partial),
+                # unless the store starts after the window (e.g. `days` grew)
+                high_water_mark = self.history_store.high_water_mark()
+                low_water_mark = self.history_store.low_water_mark()
+                covered = low_water_mark is not None and low_water_mark <= start_date
+                fetch_start = high_water_mark if covered else start_date
                 
-                response = requests.get(prometheus_url, params=params, timeout=10)
+                new_points = self.fetch_remote_cost_data(fetch_start, end_date)
+                if not new_points.empty:
+                    appended = self.history_store.append(new_points['ds'].to_numpy(), new_points['y'].to_numpy())
+                    print(f"📥 Stored {appended} cost points (fetched from {fetch_start.date()})")
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('status') == 'success' and data.get('data', {}).get('result'):
-                        result = data['data']['result'][0]
-                        values = result.get('values', [])
-                        
-                        if values:
-                            dates = [datetime.fromtimestamp(v[0]) for v in values]
-                            costs = [float(v[1]) for v in values]
-                            
-                            df = pd.DataFrame({
-                                'ds': dates,
-                                'y': costs
-                            })
-                            return df
-            except Exception as prom_error:
-                print(f"⚠️  Prometheus error: {prom_error}")
+                stored = self.history_store.load_frame(days=days)
+                if not stored.empty:
+                    return stored
+            else:
+                remote = self.fetch_remote_cost_data(start_date, end_date)
+                if not remote.empty:
+                    return remote
             
             # Fallback to mock data if all APIs fail
-            dates = pd.date_range(start=start_date, end=end_date, freq='D')
+            dates = pd.date_range(start=start_date, end=end_date, freq='D').tz_convert(None)
             base_cost = 100.0
             trend = 0.02  # 2% daily increase
             costs = [base_cost * (1 + trend) ** i for i in range(len(dates))]
@@ -129,69 +1148,229 @@ class FinBotForecaster:
             print(f"⚠️  Error fetching cost data: {e}")
             return pd.DataFrame()
     
-    def train_prophet_model(self, df: pd.DataFrame) -> Prophet:
-        """Train Prophet model on historical cost data"""
+    def resolve_engine(self, engine: Optional[str] = None, periods: Optional[int] = None) -> str:
+        """Resolve a requested engine name (prophet|ets|auto) to a concrete engine"""
+        engine = (engine or self.forecast_engine).lower()
+        if engine not in FORECAST_ENGINES:
+            raise ValueError(f"Unknown forecast engine '{engine}', expected one of {FORECAST_ENGINES}")
+        
+        if engine == 'auto':
+            # Short-horizon checks do not need a full Prophet fit
+            horizon = periods if periods is not None else self.prediction_horizon
+            if not PROPHET_AVAILABLE or horizon <= self.ets_max_horizon:
+                return 'ets'
+            return 'prophet'
+        
+        if engine == 'prophet' and not PROPHET_AVAILABLE:
+            print("⚠️  Prophet not available, falling back to ETS engine")
+            return 'ets'
+        
+        return engine
+    
+    def train_model(self, df: pd.DataFrame, engine: Optional[str] = None):
+        """Train the selected forecasting engine on historical cost data"""
         try:
-            if Prophet is None:
-                print("⚠️  Prophet not available, skipping training")
-                return None
-            
-            # Initialize Prophet model
-            model = Prophet(
-                yearly_seasonality=False,
-                weekly_seasonality=True,
-                daily_seasonality=False,
-                seasonality_mode='multiplicative'
-            )
-            
-            # Add custom seasonality
-            model.add_seasonality(name='monthly', period=30.5, fourier_order=5)
-            
-            # Fit model
+            name = self.resolve_engine(engine)
+            model = create_engine(name, pool=WARM_POOL)
             model.fit(df)
             
-            self.prophet_model = model
-            print("✅ Prophet model trained successfully")
+            self.engine = model
+            if name == 'prophet':
+                self.prophet_model = model.model
+            print(f"✅ {name} model trained successfully")
             return model
             
         except Exception as e:
             print(f"⚠️  Model training error: {e}")
             return None
     
-    def predict_future_costs(self, periods: int = 90) -> pd.DataFrame:
+    def train_prophet_model(self, df: pd.DataFrame) -> Optional['Prophet']:
+        """Train Prophet model on historical cost data.
+
+        Returns None when Prophet is unavailable or the fit is deferred to
+        the warm pool (no model lives in this process then).
+        """
+        if not PROPHET_AVAILABLE:
+            print("⚠️  Prophet not available, skipping training")
+            return None
+        
+        model = self.train_model(df, engine='prophet')
+        return model.model if model is not None else None
+    
+    def select_mode(self, latency_budget_ms: Optional[float] = None, mode: Optional[str] = None) -> str:
+        """Pick a forecast mode: explicit mode, else the richest mode expected to fit the budget"""
+        if mode:
+            if mode not in FORECAST_MODES:
+                raise ValueError(f"Unknown forecast mode '{mode}', expected one of {FORECAST_MODES}")
+            return mode
+        
+        if latency_budget_ms is None or self.engine is None:
+            return self.forecast_mode
+        
+        for candidate in reversed(FORECAST_MODES):
+            if self.mode_latency_ms.get((self.engine.name, candidate), 0.0) <= latency_budget_ms:
+                return candidate
+        return 'point'
+    
+    def predict_future_costs(self, periods: int = 90, mode: Optional[str] = None,
+                             latency_budget_ms: Optional[float] = None) -> pd.DataFrame:
         """Generate future cost predictions"""
         try:
-            if self.prophet_model is None:
+            if self.engine is None:
                 print("⚠️  Model not trained, returning empty forecast")
                 return pd.DataFrame()
             
-            # Create future dates
-            future = self.prophet_model.make_future_dataframe(periods=periods)
+            mode = self.select_mode(latency_budget_ms, mode)
+            start = time.perf_counter()
             
-            # Predict
-            forecast = self.prophet_model.predict(future)
+            # Forecast only (not historical)
+            if self.engine.name == 'prophet':
+                forecast = self.engine.predict(periods, mode=mode, interval_samples=self.interval_samples)
+            else:
+                forecast = self.engine.predict(periods, mode=mode)
             
-            # Extract forecast only (not historical)
-            forecast_df = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(periods)
+            elapsed = time.perf_counter() - start
+            key = (self.engine.name, mode)
+            self.mode_latency_ms[key] = 0.7 * self.mode_latency_ms.get(key, elapsed * 1000) + 0.3 * elapsed * 1000
+            self.prediction_latency.labels(engine=self.engine.name, mode=mode).set(elapsed)
+            self.last_mode = mode
             
-            return forecast_df
+            return forecast
             
         except Exception as e:
             print(f"⚠️  Prediction error: {e}")
             return pd.DataFrame()
     
+    def sample_cost_trajectories(self, predictions: pd.DataFrame, n_samples: Optional[int] = None) -> np.ndarray:
+        """Draw (samples x horizon) cost trajectories from the current forecast's uncertainty"""
+        n_samples = n_samples or self.scenario_samples
+        
+        if isinstance(self.engine, ProphetEngine) and self.engine.model is not None:
+            # Prophet's own posterior samples for the forecast rows only
+            try:
+                future = predictions[['ds']].reset_index(drop=True)
+                samples = self.engine.model.predictive_samples(future)['yhat'].T
+                if samples.shape[0] >= n_samples:
+                    return samples[:n_samples]
+                return samples[np.random.default_rng().integers(0, samples.shape[0], n_samples)]
+            except Exception as e:
+                print(f"⚠️  Prophet predictive sampling failed, using interval sampling: {e}")
+        
+        return BudgetScenarioEngine(n_samples=n_samples).sample_from_intervals(predictions)
+    
+    def default_budget(self, historical: pd.DataFrame) -> float:
+        """Configured budget, or the actual spend of the trailing budget period"""
+        if self.budget:
+            return self.budget
+        return float(historical['y'].tail(self.budget_period_days).sum())
+    
+    def forecast_batch(self, values: np.ndarray, periods: int) -> Dict[str, np.ndarray]:
+        """Forecast many cost series at once with the vectorized ETS engine.
+        
+        `values` is a (series x days) array; the result holds (series x periods)
+        arrays for yhat, yhat_lower and yhat_upper.
+        """
+        return ETSEngine().fit_arrays(values).forecast_arrays(periods)
+    
+    def benchmark_engines(self, df: Optional[pd.DataFrame] = None, horizon: int = 14,
+                          n_series: int = 1000) -> Dict[str, Any]:
+        """Compare engine accuracy and latency on a holdout of the cost history"""
+        if df is None:
+            df = self.fetch_historical_cost_data(days=90)
+        
+        train, test = df.iloc[:-horizon], df.iloc[-horizon:]
+        actual = test['y'].to_numpy(dtype=float)
+        engines = ['ets'] + (['prophet'] if PROPHET_AVAILABLE else [])
+        report: Dict[str, Any] = {'horizon': horizon, 'train_points': len(train), 'engines': {}}
+        
+        for name in engines:
+            model = create_engine(name)
+            
+            start = time.perf_counter()
+            model.fit(train)
+            fit_ms = (time.perf_counter() - start) * 1000
+            
+            start = time.perf_counter()
+            forecast = model.predict(horizon)
+            predict_ms = (time.perf_counter() - start) * 1000
+            
+            yhat = forecast['yhat'].to_numpy()
+            lower = forecast['yhat_lower'].to_numpy()
+            upper = forecast['yhat_upper'].to_numpy()
+            report['engines'][name] = {
+                'fit_ms': round(fit_ms, 3),
+                'predict_ms': round(predict_ms, 3),
+                'mape': float(np.mean(np.abs((actual - yhat) / np.where(actual == 0, 1, actual))) * 100),
+                'rmse': float(np.sqrt(np.mean((actual - yhat) ** 2))),
+                'coverage': float(np.mean((actual >= lower) & (actual <= upper))),
+            }
+        
+        # Batch throughput: perturbed copies of the training history as a 2-D panel
+        rng = np.random.default_rng(42)
+        base = train['y'].to_numpy(dtype=float)
+        panel = base[None, :] * rng.uniform(0.5, 1.5, (n_series, 1)) \
+            + rng.normal(0, base.std() * 0.05 + 1e-9, (n_series, base.size))
+        
+        start = time.perf_counter()
+        self.forecast_batch(panel, horizon)
+        batch_ms = (time.perf_counter() - start) * 1000
+        report['ets_batch'] = {
+            'series': n_series,
+            'total_ms': round(batch_ms, 3),
+            'series_per_second': round(n_series / (batch_ms / 1000), 1),
+        }
+        
+        return report
+    
+    def benchmark_serializers(self, n_series: int = 500, horizon: int = 90) -> Dict[str, Any]:
+        """Compare encode time and payload size of each response format and encoding"""
+        rng = np.random.default_rng(42)
+        rows = n_series * horizon
+        yhat = rng.uniform(100, 500, rows)
+        predictions = pd.DataFrame({
+            'ds': np.tile(pd.date_range(datetime.now().date(), periods=horizon, freq='D'), n_series),
+            'series': np.repeat(np.arange(n_series), horizon),
+            'yhat': yhat,
+            'yhat_lower': yhat * 0.9,
+            'yhat_upper': yhat * 1.1,
+        })
+        results = {'engine': 'ets', 'correlation': 0.0, 'roi_score': 50.0,
+                   'predictions': predictions, 'timestamp': datetime.now().isoformat()}
+        report: Dict[str, Any] = {'rows': rows, 'formats': {}}
+        
+        for name, media_type in RESPONSE_FORMATS.items():
+            if media_type not in available_media_types():
+                continue
+            
+            start = time.perf_counter()
+            body = serialize_forecast(results, media_type)
+            encode_ms = (time.perf_counter() - start) * 1000
+            entry = {'encode_ms': round(encode_ms, 3), 'bytes': len(body)}
+            
+            for encoding in ('gzip', 'zstd'):
+                start = time.perf_counter()
+                compressed, applied = compress_body(body, encoding)
+                if applied == encoding:
+                    entry[f'{encoding}_ms'] = round((time.perf_counter() - start) * 1000, 3)
+                    entry[f'{encoding}_bytes'] = len(compressed)
+            
+            report['formats'][name] = entry
+        
+        return report
+    
     def calculate_correlation(self, historical: pd.DataFrame, predicted: pd.DataFrame) -> float:
-        """Calculate correlation between historical trend and predictions"""
+        """Correlation between actual costs and predictions made for the same days"""
         try:
             if historical.empty or predicted.empty:
                 return 0.0
             
-            # Align data
-            historical_trend = historical['y'].values[-len(predicted):]
-            predicted_trend = predicted['yhat'].values
+            # Align on date; only out-of-sample predictions overlap with history
+            aligned = pd.merge(historical[['ds', 'y']], predicted[['ds', 'yhat']], on='ds')
+            if len(aligned) < 3:
+                return 0.0
             
             # Calculate correlation
-            correlation = np.corrcoef(historical_trend, predicted_trend)[0, 1]
+            correlation = np.corrcoef(aligned['y'].values, aligned['yhat'].values)[0, 1]
             
             # Handle NaN
             if np.isnan(correlation):
@@ -203,6 +1382,50 @@ class FinBotForecaster:
             print(f"⚠️  Correlation calculation error: {e}")
             return 0.0
     
+    def run_backtest(self, historical: pd.DataFrame, engine: Optional[str] = None,
+                     cached_only: bool = False) -> Dict[str, Any]:
+        """Backtest an engine on the history and export its per-horizon accuracy"""
+        try:
+            name = self.resolve_engine(engine, periods=self.backtest_horizon)
+            history = historical.assign(ds=historical['ds'].dt.normalize())
+            report = self.backtester.run(history, name, horizon=self.backtest_horizon,
+                                         period=self.backtest_period, window=self.backtest_window,
+                                         cached_only=cached_only)
+            
+            if report.get('folds'):
+                for step in range(self.backtest_horizon):
+                    labels = {'engine': name, 'horizon': str(step + 1)}
+                    self.backtest_mape.labels(**labels).set(report['mape'][step])
+                    self.backtest_rmse.labels(**labels).set(report['rmse'][step])
+                    self.backtest_coverage.labels(**labels).set(report['coverage'][step])
+            
+            return report
+            
+        except Exception as e:
+            print(f"⚠️  Backtest error: {e}")
+            return {}
+    
+    def compare_engines(self, historical: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """Backtest every available engine on the same folds"""
+        if historical is None:
+            historical = self.fetch_historical_cost_data(days=self.training_days)
+        
+        engines = ['ets'] + (['prophet'] if PROPHET_AVAILABLE else [])
+        comparison = {}
+        for name in engines:
+            report = self.run_backtest(historical, engine=name)
+            if report.get('folds'):
+                comparison[name] = {
+                    'folds': report['folds'],
+                    'cached_folds': report['cached_folds'],
+                    'mape': report['mape'].round(3).tolist(),
+                    'rmse': report['rmse'].round(3).tolist(),
+                    'coverage': report['coverage'].round(3).tolist(),
+                    'correlation': self.calculate_correlation(historical.assign(ds=historical['ds'].dt.normalize()),
+                                                              report['predictions']),
+                }
+        return comparison
+    
     def calculate_roi_score(self, predicted_costs: pd.DataFrame, current_costs: float) -> float:
         """Calculate ROI optimization score based on cost predictions"""
         try:
@@ -227,9 +1450,13 @@ class FinBotForecaster:
             return 50.0
     
     def export_metrics_to_prometheus(self, predictions: pd.DataFrame, correlation: float, 
-                                    roi_score: float, budget_variance: float):
+                                    roi_score: float, budget_variance: Optional[float],
+                                    overrun_probability: Optional[float] = None):
         """Export FinBot metrics to Prometheus"""
         try:
+            if overrun_probability is not None:
+                self.budget_overrun_probability.set(overrun_probability)
+            
             if not predictions.empty:
                 # Export predictions for different periods
                 self.cost_prediction.labels(period='7d').set(predictions['yhat'].head(7).mean())
@@ -238,7 +1465,8 @@ class FinBotForecaster:
             
             self.cost_correlation.set(correlation)
             self.roi_score.set(roi_score)
-            self.budget_variance.set(budget_variance)
+            if budget_variance is not None:
+                self.budget_variance.set(budget_variance)
             
             # Push metrics
             push_to_gateway(
@@ -252,21 +1480,25 @@ class FinBotForecaster:
         except Exception as e:
             print(f"⚠️  Prometheus export error: {e}")
     
-    def run_forecast(self) -> Dict[str, Any]:
-        """Main forecasting workflow"""
+    def run_forecast(self, engine: Optional[str] = None, mode: Optional[str] = None,
+                     latency_budget_ms: Optional[float] = None,
+                     historical_data: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """Main forecasting workflow (on `historical_data` if the caller already fetched it)"""
         print("💰 Starting FinBot v2.0 Cost & ROI Forecasting...")
         
         # Fetch historical data
-        print("📊 Fetching historical cost data...")
-        historical_data = self.fetch_historical_cost_data(days=90)
+        if historical_data is None:
+            print("📊 Fetching historical cost data...")
+            historical_data = self.fetch_historical_cost_data(days=self.training_days)
         
         if historical_data.empty:
             print("❌ No historical data available")
             return {}
         
         # Train model
-        print("🧠 Training Prophet model...")
-        model = self.train_prophet_model(historical_data)
+        engine_name = self.resolve_engine(engine)
+        print(f"🧠 Training {engine_name} model...")
+        model = self.train_model(historical_data, engine=engine_name)
         
         if model is None:
             print("❌ Model training failed")
@@ -274,25 +1506,52 @@ class FinBotForecaster:
         
         # Predict future costs
         print(f"🔮 Predicting costs for next {self.prediction_horizon} days...")
-        predictions = self.predict_future_costs(periods=self.prediction_horizon)
+        predictions = self.predict_future_costs(periods=self.prediction_horizon, mode=mode,
+                                                latency_budget_ms=latency_budget_ms)
         
         if predictions.empty:
             print("❌ Prediction failed")
             return {}
         
-        # Calculate correlation
-        correlation = self.calculate_correlation(historical_data, predictions)
+        # Correlation of out-of-sample backtest predictions with actual costs
+        # (from cached folds only unless the backtest is enabled)
+        correlation = 0.0
+        if self.backtest_enabled:
+            print("🧪 Backtesting forecast accuracy...")
+        backtest = self.run_backtest(historical_data, engine=engine_name, cached_only=not self.backtest_enabled)
+        if backtest.get('folds'):
+            normalized = historical_data.assign(ds=historical_data['ds'].dt.normalize())
+            correlation = self.calculate_correlation(normalized, backtest['predictions'])
         self.correlation_score = correlation
         
         # Calculate ROI score
         current_cost = historical_data['y'].iloc[-1]
         roi_score = self.calculate_roi_score(predictions, current_cost)
         
-        # Calculate budget variance (mock for now)
-        budget_variance = 0.0
+        # Budget variance from Monte Carlo cost trajectories (skipped when a
+        # point forecast leaves no uncertainty to sample)
+        budget = self.default_budget(historical_data)
+        budget_variance = overrun_probability = None
+        try:
+            trajectories = self.sample_cost_trajectories(predictions)
+            scenario = BudgetScenarioEngine().evaluate(trajectories, [budget],
+                                                       period_days=self.budget_period_days)
+            budget_variance = float(scenario['expected_variance_pct'][0, 0])
+            overrun_probability = float(scenario['overrun_probability'][0, 0])
+        except ValueError as e:
+            print(f"⚠️  Budget variance skipped: {e}")
+        
+        # Startup cost metrics (import is lazy, so it lands on the first Prophet forecast)
+        global FIRST_FORECAST_SECONDS
+        if FIRST_FORECAST_SECONDS is None:
+            FIRST_FORECAST_SECONDS = time.monotonic() - PROCESS_START
+        self.time_to_first_forecast.set(FIRST_FORECAST_SECONDS)
+        if PROPHET_IMPORT_SECONDS is not None:
+            self.prophet_import_seconds.set(PROPHET_IMPORT_SECONDS)
         
         # Export to Prometheus
-        self.export_metrics_to_prometheus(predictions, correlation, roi_score, budget_variance)
+        self.export_metrics_to_prometheus(predictions, correlation, roi_score, budget_variance,
+                                          overrun_probability)
         
         # Print summary
         print(f"\n💰 FinBot Forecast Summary:")
@@ -300,18 +1559,56 @@ class FinBotForecaster:
         print(f"   ROI Score: {roi_score:.1f}")
         print(f"   Current Cost: ${current_cost:.2f}")
         print(f"   Predicted 30d Avg: ${predictions['yhat'].head(30).mean():.2f}")
+        if budget_variance is not None:
+            print(f"   Budget Variance: {budget_variance:+.1f}% (overrun p={overrun_probability:.2f})")
         
         return {
+            'engine': engine_name,
+            'mode': self.last_mode,
             'correlation': correlation,
             'roi_score': roi_score,
-            'predictions': predictions.to_dict('records'),
+            'budget': budget,
+            'budget_variance': budget_variance,
+            'budget_overrun_probability': overrun_probability,
+            'predictions': predictions,
             'timestamp': datetime.now().isoformat()
         }
 
 
+SHARED_STORE = SharedForecastStore(SHARED_RESULTS_PATH) if SHARED_RESULTS_PATH else None
+
+# Streaming cost anomaly detection (per worker) and its metrics; handlers
+# run in the threadpool, so the detector state is updated under a lock
+COST_DETECTOR = CostAnomalyDetector(
+    alpha=float(os.getenv('FINBOT_ANOMALY_EWMA_ALPHA', '0.1')),
+    threshold=float(os.getenv('FINBOT_ANOMALY_THRESHOLD', '3.0')),
+)
+COST_DETECTOR_LOCK = threading.Lock()
+ANOMALY_REGISTRY = CollectorRegistry()
+COST_ANOMALY_TOTAL = Counter('finbot_cost_anomaly_total', 'Cost points flagged as anomalous',
+                             ['direction'], registry=ANOMALY_REGISTRY)
+COST_POINTS_SCORED_TOTAL = Counter('finbot_cost_points_scored_total', 'Cost points scored against the forecast band',
+                                   registry=ANOMALY_REGISTRY)
+COST_ANOMALY_SCORE = Gauge('finbot_cost_anomaly_score', 'Residual z-score of the latest cost point',
+                           registry=ANOMALY_REGISTRY)
+
+
 def main():
     """Main entry point"""
     forecaster = FinBotForecaster()
+    
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        print(json.dumps(forecaster.benchmark_engines(), indent=2))
+        sys.exit(0)
+    
+    if len(sys.argv) > 1 and sys.argv[1] == 'backtest':
+        print(json.dumps(forecaster.compare_engines(), indent=2))
+        sys.exit(0)
+    
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark-serializers':
+        print(json.dumps(forecaster.benchmark_serializers(), indent=2))
+        sys.exit(0)
+    
     results = forecaster.run_forecast()
     
     if results:
@@ -331,17 +1628,224 @@ async def health() -> Dict[str, str]:
     """Simple health endpoint for readiness/liveness probes."""
     return {
         'status': 'ok',
-        'timestamp': datetime.utcnow().isoformat(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
     }
 
 
 @app.post('/forecast')
-async def forecast() -> Dict[str, Any]:
-    """Trigger a forecast run and return the latest metrics."""
+def forecast(
+    request: Request,
+    engine: str = 'auto',
+    mode: Optional[str] = None,
+    latency_budget_ms: Optional[float] = Query(None, gt=0),
+    response_format: Optional[str] = Query(None, alias='format'),
+) -> Response:
+    """Trigger a forecast run and return the latest metrics.
+
+    `mode` (point|interval|full) or `latency_budget_ms` control how much
+    uncertainty estimation is paid for. The body format follows `format` (json|columnar|msgpack|arrow) or the
+    Accept header, and is zstd/gzip-compressed according to Accept-Encoding.
+    """
+    if engine not in FORECAST_ENGINES:
+        raise HTTPException(status_code=400, detail=f'engine must be one of {FORECAST_ENGINES}')
+    if mode is not None and mode not in FORECAST_MODES:
+        raise HTTPException(status_code=400, detail=f'mode must be one of {FORECAST_MODES}')
+
+    media_type = negotiate_media_type(request.headers.get('accept'), response_format)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f'Supported media types: {available_media_types()}')
+
     forecaster = FinBotForecaster()
-    results = forecaster.run_forecast()
+    results = forecaster.run_forecast(engine=engine, mode=mode, latency_budget_ms=latency_budget_ms)
 
     if not results:
         raise HTTPException(status_code=500, detail='Forecast execution failed')
 
-    return results
+    # Point forecasts carry no band, so they neither replace the shared
+    # forecast nor the anomaly band
+    if results['mode'] != 'point':
+        if SHARED_STORE is not None:
+            SHARED_STORE.publish(results)
+        with COST_DETECTOR_LOCK:
+            COST_DETECTOR.set_band(results['predictions'], version=results['timestamp'])
+
+    body, encoding = compress_body(serialize_forecast(results, media_type),
+                                   request.headers.get('accept-encoding'))
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+class ScenarioRequest(BaseModel):
+    """Batch of budget / what-if scenarios evaluated against one forecast"""
+
+    budgets: Optional[List[float]] = Field(None, description='Budgets (USD) for the period; default is the configured budget')
+    multipliers: List[float] = Field([1.0], min_length=1, description='What-if cost multipliers')
+    period_days: int = Field(30, ge=1, le=365)
+    samples: int = Field(5000, ge=100, le=100000)
+    quantiles: List[float] = Field([0.05, 0.5, 0.95], min_length=1)
+    engine: str = 'auto'
+
+
+@app.post('/forecast/scenarios')
+def forecast_scenarios(request: ScenarioRequest) -> Dict[str, Any]:
+    """Evaluate many budget and what-if multiplier scenarios in one batch."""
+    if request.engine not in FORECAST_ENGINES:
+        raise HTTPException(status_code=400, detail=f'engine must be one of {FORECAST_ENGINES}')
+    if request.budgets is not None and any(budget <= 0 for budget in request.budgets):
+        raise HTTPException(status_code=400, detail='budgets must be positive')
+    if any(not 0 <= q <= 1 for q in request.quantiles):
+        raise HTTPException(status_code=400, detail='quantiles must be within [0, 1]')
+
+    forecaster = FinBotForecaster()
+    historical = forecaster.fetch_historical_cost_data(days=forecaster.training_days)
+    if historical.empty or forecaster.train_model(historical, engine=forecaster.resolve_engine(
+            request.engine, periods=request.period_days)) is None:
+        raise HTTPException(status_code=500, detail='Forecast execution failed')
+
+    predictions = forecaster.predict_future_costs(periods=request.period_days, mode='interval')
+    if predictions.empty:
+        raise HTTPException(status_code=500, detail='Forecast execution failed')
+
+    start = time.perf_counter()
+    budgets = request.budgets or [forecaster.default_budget(historical)]
+    trajectories = forecaster.sample_cost_trajectories(predictions, request.samples)
+    result = BudgetScenarioEngine().evaluate(trajectories, budgets, request.multipliers,
+                                             request.period_days, request.quantiles)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    scenarios = [
+        {
+            'budget': budget,
+            'multiplier': multiplier,
+            'expected_spend': float(result['expected_spend'][j]),
+            'overrun_probability': float(result['overrun_probability'][i, j]),
+            'expected_variance_pct': float(result['expected_variance_pct'][i, j]),
+            'variance_quantiles': {
+                str(q): float(result['variance_quantiles'][k, i, j]) for k, q in enumerate(request.quantiles)
+            },
+        }
+        for i, budget in enumerate(budgets)
+        for j, multiplier in enumerate(request.multipliers)
+    ]
+
+    return {
+        'engine': forecaster.engine.name,
+        'period_days': request.period_days,
+        'samples': int(trajectories.shape[0]),
+        'elapsed_ms': round(elapsed_ms, 3),
+        'scenarios': scenarios,
+        'timestamp': datetime.now().isoformat(),
+    }
+
+
+@app.post('/forecast/backtest')
+def forecast_backtest() -> Dict[str, Any]:
+    """Run (incremental) rolling-origin backtests and compare available engines."""
+    forecaster = FinBotForecaster()
+    comparison = forecaster.compare_engines()
+
+    if not comparison:
+        raise HTTPException(status_code=500, detail='Backtest produced no folds')
+
+    return {
+        'horizon': forecaster.backtest_horizon,
+        'period': forecaster.backtest_period,
+        'window': forecaster.backtest_window,
+        'engines': comparison,
+        'timestamp': datetime.now().isoformat(),
+    }
+
+
+@app.get('/forecast/latest')
+def forecast_latest(
+    request: Request,
+    response_format: Optional[str] = Query(None, alias='format'),
+) -> Response:
+    """Serve the shared forecast; only one worker recomputes it when stale."""
+    if SHARED_STORE is None:
+        raise HTTPException(status_code=404, detail='Shared forecast results are disabled')
+
+    media_type = negotiate_media_type(request.headers.get('accept'), response_format)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f'Supported media types: {available_media_types()}')
+
+    snapshot = SHARED_STORE.get_or_compute(lambda: FinBotForecaster().run_forecast(), SHARED_MAX_AGE_SECONDS)
+    if snapshot is None:
+        raise HTTPException(status_code=500, detail='Forecast execution failed')
+
+    body, encoding = compress_body(serialize_forecast(snapshot['results'], media_type),
+                                   request.headers.get('accept-encoding'))
+    headers = {
+        'Vary': 'Accept, Accept-Encoding',
+        'X-Forecast-Version': str(snapshot['version']),
+        'X-Forecast-Published-At': datetime.fromtimestamp(snapshot['published_at'], tz=timezone.utc).isoformat(),
+    }
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+class CostPoint(BaseModel):
+    """One observed cost point"""
+
+    timestamp: datetime
+    cost: float
+
+
+class CostObservation(BaseModel):
+    """Batch of newly arrived cost points (daily totals or hourly costs)"""
+
+    points: List[CostPoint] = Field(..., min_length=1)
+    granularity: str = Field('day', pattern='^(day|hour)$')
+
+
+@app.post('/costs/observe')
+def observe_costs(observation: CostObservation) -> Dict[str, Any]:
+    """Score incoming cost points against the cached forecast band as they arrive."""
+    # Keep the band in sync with the shared forecast, or compute one on first use
+    snapshot = SHARED_STORE.read() if SHARED_STORE is not None else None
+    if snapshot and snapshot['results'].get('mode') == 'point':
+        snapshot = None
+    results = None
+    if not snapshot and not COST_DETECTOR.band:
+        results = FinBotForecaster().run_forecast(mode='interval')
+        if not results:
+            raise HTTPException(status_code=500, detail='No forecast band available')
+
+    with COST_DETECTOR_LOCK:
+        if snapshot and snapshot['version'] != COST_DETECTOR.band_version:
+            COST_DETECTOR.set_band(snapshot['results']['predictions'], version=snapshot['version'])
+        elif results:
+            COST_DETECTOR.set_band(results['predictions'], version=results['timestamp'])
+        events = [COST_DETECTOR.update(point.timestamp, point.cost, observation.granularity)
+                  for point in observation.points]
+    anomalies = [event for event in events if event['anomaly']]
+
+    scored = [event for event in events if event['status'] == 'scored']
+    COST_POINTS_SCORED_TOTAL.inc(len(scored))
+    if scored:
+        COST_ANOMALY_SCORE.set(scored[-1]['score'])
+    for event in anomalies:
+        COST_ANOMALY_TOTAL.labels(direction=event['direction']).inc()
+        print(f"🚨 finbot_cost_anomaly: {json.dumps(event)}")
+
+    if anomalies:
+        try:
+            push_to_gateway(
+                gateway=os.getenv('PROMETHEUS_GATEWAY', 'http://prometheus:9091'),
+                job='finbot-v2-anomaly',
+                registry=ANOMALY_REGISTRY,
+                grouping_key={'instance': f'{os.uname().nodename}-{os.getpid()}'}
+            )
+        except Exception as e:
+            print(f"⚠️  Prometheus export error: {e}")
+
+    return {
+        'scored': len(scored),
+        'anomalies': anomalies,
+        'events': events,
+        'band_version': str(COST_DETECTOR.band_version),
+        'timestamp': datetime.now().isoformat(),
+    }